@@ -0,0 +1,57 @@
+'''
+Benchmark per-box label helpers against the vectorized geometry module.
+
+Run from the repository root:
+    python -m benchmarks.bench_bbox --boxes 1000000
+'''
+import argparse
+import time
+
+from src.utils import geometry
+
+from .fixtures import random_boxes
+
+
+def legacy_bbox_xxyy(bbox):
+    # Original per-box implementation, kept here as the benchmark reference
+    _, x_center, y_center, width, height = map(float, bbox)
+    return (x_center - width / 2, y_center - height / 2, x_center + width / 2, y_center + height / 2)
+
+
+def legacy_bbox_area(bbox):
+    # Original per-box implementation, kept here as the benchmark reference
+    _, x_center, y_center, width, height = map(float, bbox)
+    return width * height
+
+
+def timed(func):
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--boxes', type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    boxes = random_boxes(args.boxes)
+    tokens = [[str(v) for v in row] for row in boxes.tolist()]
+
+    results = {
+        'xyxy (per box)': timed(lambda: [legacy_bbox_xxyy(b) for b in tokens]),
+        'xyxy (vectorized)': timed(lambda: geometry.convert(boxes, 'yolo', 'xyxy')),
+        'area (per box)': timed(lambda: [legacy_bbox_area(b) for b in tokens]),
+        'area (vectorized)': timed(lambda: geometry.area(boxes)),
+        'clip + filter (vectorized)': timed(lambda: geometry.filter_area(geometry.clip(boxes), 1e-4)),
+        'iou 2k x 2k (vectorized)': timed(lambda: geometry.iou(boxes[:2000], boxes[2000:4000])),
+    }
+
+    print(f"{args.boxes} boxes")
+    for name, seconds in results.items():
+        print(f"{name:28s} {seconds * 1000:10.1f} ms")
+    print(f"xyxy speedup: {results['xyxy (per box)'] / results['xyxy (vectorized)']:.0f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+'''
+Benchmark PIL paste with per-object label appends against composite.
+
+Run from the repository root:
+    python -m benchmarks.bench_composite --images 200
+'''
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+from src.utils import synth
+
+from .fixtures import random_sprites
+
+
+def bench_paste(canvas, plans, out_dir):
+    start = time.perf_counter()
+    for i, plan in enumerate(plans):
+        img = Image.fromarray(canvas)
+        canvas_size = img.size
+        for sprite, pos in plan:
+            # Mirrors the notebook loop: paste, then append one label line
+            img.paste(sprite, pos, sprite)
+            ann = [0, (pos[0] + sprite.size[0] / 2) / canvas_size[0], (pos[1] + sprite.size[1] / 2) / canvas_size[1],
+                   sprite.size[0] / canvas_size[0], sprite.size[1] / canvas_size[1]]
+            with open(os.path.join(out_dir, f"paste_{i:05d}.txt"), "a") as ann_file:
+                ann_file.write(" ".join([str(a) for a in ann]) + "\n")
+    return len(plans) / (time.perf_counter() - start)
+
+
+def bench_composite(canvas, plans, out_dir):
+    start = time.perf_counter()
+    for i, plan in enumerate(plans):
+        _, labels = synth.composite(canvas.copy(), plan)
+        synth.write_labels(os.path.join(out_dir, f"composite_{i:05d}.txt"), labels)
+    return len(plans) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--images', type=int, default=200)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(1)
+    canvas = rng.integers(0, 255, size=(1080, 1920, 3), dtype=np.uint8)
+    sprites = random_sprites(64)
+
+    plans = []
+    for _ in range(args.images):
+        plan = []
+        for _ in range(rng.integers(1, 6)):
+            sprite = sprites[rng.integers(len(sprites))]
+            plan.append((sprite, (int(rng.integers(0, 1800)), int(rng.integers(0, 960)))))
+        plans.append(plan)
+    pil_plans = [[(Image.fromarray(s, "RGBA"), pos) for s, pos in plan] for plan in plans]
+
+    with tempfile.TemporaryDirectory() as out_dir:
+        paste_rate = bench_paste(canvas, pil_plans, out_dir)
+        composite_rate = bench_composite(canvas, plans, out_dir)
+
+    print(f"PIL paste + per-object append: {paste_rate:8.1f} images/s")
+    print(f"composite + write_labels:      {composite_rate:8.1f} images/s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+'''
+Benchmark batched embedding against per-image predict, as the diversity notebook runs it.
+
+Needs ultralytics and a YOLO checkpoint. Run from the repository root:
+    python -m benchmarks.bench_embed --weights yolov8n.pt --images 64
+'''
+import argparse
+import os
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+from src.utils import diversity
+
+from .fixtures import random_canvas
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--weights', default='yolov8n.pt')
+    parser.add_argument('--images', type=int, default=64)
+    parser.add_argument('--batch-size', type=int, default=16)
+    parser.add_argument('--layers', type=int, nargs='+', default=(10, 14, 17))
+    args = parser.parse_args()
+
+    from ultralytics import YOLO
+
+    model = YOLO(args.weights)
+    layers = list(args.layers)
+    # Two frame sizes, so batches mix shapes as the data blends do
+    sizes = [(1920, 1080), (720, 576)]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        paths = []
+        for i in range(args.images):
+            path = os.path.join(tmp_dir, f"img_{i:04d}.png")
+            cv2.imwrite(path, random_canvas(*sizes[i % len(sizes)], seed=i))
+            paths.append(path)
+
+        def per_image():
+            return [model.predict(cv2.imread(path), embed=layers, verbose=False)[0].detach().cpu().numpy().reshape(-1)
+                    for path in paths]
+
+        reference_time, reference = timed(per_image)
+        batched_time, batched = timed(lambda: [embedding for _, embedding in diversity.embed_images(
+            model, paths, layers=layers, batch_size=args.batch_size)])
+        # One image alone must embed as it does inside a mixed batch
+        _, alone = timed(lambda: [embedding for _, embedding in diversity.embed_images(model, paths[1:2], layers=layers)])
+
+    for expected, embedding in zip(reference, batched):
+        assert np.allclose(expected, embedding, atol=1e-5)
+    assert np.allclose(alone[0], batched[1], atol=1e-5)
+
+    print(f"Images {args.images}, batch size {args.batch_size}")
+    print(f"per-image predict: {reference_time:8.2f} s")
+    print(f"embed_images:      {batched_time:8.2f} s")
+    print(f"Speedup:           {reference_time / batched_time:8.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+'''
+Benchmark import time and memory of the utils package and each submodule.
+
+Each import runs in a fresh interpreter, as a spawned worker process would.
+Run from the repository root:
+    python -m benchmarks.bench_import --repeat 5
+'''
+import argparse
+import subprocess
+import sys
+
+MODULES = [
+    'src.utils',
+    'src.utils.geometry',
+    'src.utils.label_data',
+    'src.utils.files',
+    'src.utils.image_data',
+    'src.utils.video_data',
+    'src.utils.diversity',
+    'src.utils.synth',
+    'src.utils.synth+vtk',
+]
+
+PROBE = '''
+import resource, sys, time
+start = time.perf_counter()
+import {module}
+{touch}
+seconds = time.perf_counter() - start
+print(seconds, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+'''
+
+
+def measure(module, repeat):
+    # Best of several fresh interpreters, memory is the peak resident size
+    name, _, extra = module.partition('+')
+    touch = f"{name}.{extra}.vtkPolyData" if extra else ''
+    runs = []
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, '-c', PROBE.format(module=name, touch=touch)],
+                             capture_output=True, text=True, check=True).stdout.split()
+        runs.append((float(out[0]), int(out[1])))
+    seconds = min(run[0] for run in runs)
+    max_rss = min(run[1] for run in runs)
+    return seconds, max_rss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    for module in MODULES:
+        seconds, rss_mb = measure(module, args.repeat)
+        print(f"{module:26s} {seconds * 1000:8.1f} ms {rss_mb:8.1f} MB")
+
+
+if __name__ == '__main__':
+    main()
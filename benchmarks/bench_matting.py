@@ -0,0 +1,78 @@
+'''
+Benchmark the legacy per-pixel matting against the vectorized chroma_key.
+
+Run from the repository root:
+    python -m benchmarks.bench_matting --size 1024 768
+'''
+import argparse
+import time
+
+import numpy as np
+from PIL import Image
+
+from src.utils import synth
+
+from .fixtures import green_screen_sprite
+
+
+def legacy_object_mask(obj_image):
+    # Original implementation, kept here as the benchmark reference
+    red_arr = np.array(obj_image.split()[0])
+    green_arr = np.array(obj_image.split()[1])
+    blue_arr = np.array(obj_image.split()[2])
+    mask = np.zeros(green_arr.shape, dtype=np.uint8)
+    mask[(green_arr > red_arr) & (green_arr > blue_arr)] = 255
+    return Image.fromarray(mask)
+
+
+def legacy_object_alpha(obj_image, obj_mask):
+    # Original implementation, kept here as the benchmark reference
+    obj_image = obj_image.convert("RGBA")
+    obj_mask = obj_mask.convert("L")
+    output_image = Image.new("RGBA", obj_image.size)
+    obj_pixels = obj_image.load()
+    mask_pixels = obj_mask.load()
+    output_pixels = output_image.load()
+    for y in range(obj_image.height):
+        for x in range(obj_image.width):
+            r, g, b, a = obj_pixels[x, y]
+            if mask_pixels[x, y] == 0:
+                output_pixels[x, y] = (r, g, b, 255)
+            else:
+                output_pixels[x, y] = (0, 0, 0, 0)
+    return output_image
+
+
+def timed(func, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        result = func()
+    return (time.perf_counter() - start) / repeats, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--size', type=int, nargs=2, default=(1024, 768))
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+
+    img = green_screen_sprite(*args.size)
+
+    legacy_time, legacy = timed(lambda: legacy_object_alpha(img, legacy_object_mask(img)), 1)
+    alpha_time, vectorized = timed(lambda: synth.object_alpha(img, synth.object_mask(img)), args.repeats)
+    hard_time, hard = timed(lambda: synth.chroma_key(img), args.repeats)
+    soft_time, _ = timed(lambda: synth.chroma_key(img, soft=True, feather=2, despill=True), args.repeats)
+
+    assert np.array_equal(np.asarray(legacy), np.asarray(vectorized))
+    assert np.array_equal(np.asarray(legacy), np.asarray(hard))
+
+    print(f"Image size {args.size[0]}x{args.size[1]}")
+    print(f"legacy object_mask + object_alpha: {legacy_time * 1000:10.1f} ms")
+    print(f"object_mask + object_alpha:        {alpha_time * 1000:10.1f} ms")
+    print(f"chroma_key (hard):                 {hard_time * 1000:10.1f} ms")
+    print(f"chroma_key (soft, feather, spill): {soft_time * 1000:10.1f} ms")
+    print(f"Speedup (hard vs legacy):          {legacy_time / hard_time:10.1f}x")
+
+
+if __name__ == '__main__':
+    main()
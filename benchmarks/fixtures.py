@@ -0,0 +1,217 @@
+'''
+Procedural fixtures for the benchmarks, built locally without network access.
+
+Every builder is seeded, so two runs on the same machine time the same data.
+'''
+import os
+
+import cv2
+import numpy as np
+from PIL import Image
+
+
+def drone_mesh():
+    '''
+    Build a simple quadcopter-like mesh (body plus four rotor discs).
+    '''
+    import vtk
+
+    append = vtk.vtkAppendPolyData()
+
+    body = vtk.vtkCubeSource()
+    body.SetXLength(300)
+    body.SetYLength(300)
+    body.SetZLength(80)
+    append.AddInputConnection(body.GetOutputPort())
+
+    for x, y in ((-250, -250), (-250, 250), (250, -250), (250, 250)):
+        rotor = vtk.vtkCylinderSource()
+        rotor.SetRadius(120)
+        rotor.SetHeight(20)
+        rotor.SetResolution(32)
+        rotor.SetCenter(x, 0, y)
+        append.AddInputConnection(rotor.GetOutputPort())
+
+    append.Update()
+    return append.GetOutput()
+
+
+def write_stl(file_path):
+    '''
+    Write the drone mesh as a binary STL file, as load_3d_model reads it.
+    '''
+    import vtk
+
+    writer = vtk.vtkSTLWriter()
+    writer.SetFileName(file_path)
+    writer.SetInputData(drone_mesh())
+    writer.SetFileTypeToBinary()
+    writer.Write()
+    return file_path
+
+
+def green_screen_sprite(width, height, seed=0):
+    '''
+    Build a synthetic clip-art image: a colored ellipse on a green background.
+    '''
+    rng = np.random.default_rng(seed)
+    yy, xx = np.mgrid[0:height, 0:width]
+    inside = ((xx - width / 2) / (width / 3)) ** 2 + ((yy - height / 2) / (height / 4)) ** 2 < 1
+
+    arr = np.empty((height, width, 3), dtype=np.uint8)
+    arr[:] = (40, 200, 60)
+    arr[inside] = rng.integers(0, 150, size=(inside.sum(), 3), dtype=np.uint8)
+    return Image.fromarray(arr, "RGB")
+
+
+def random_sprites(count, seed=0):
+    '''
+    Build RGBA sprites with an opaque ellipse and a transparent surround.
+    '''
+    rng = np.random.default_rng(seed)
+    sprites = []
+    for _ in range(count):
+        height, width = rng.integers(10, 120, size=2)
+        yy, xx = np.mgrid[0:height, 0:width]
+        inside = ((xx - width / 2) / (width / 2)) ** 2 + ((yy - height / 2) / (height / 2)) ** 2 < 1
+        sprite = rng.integers(0, 255, size=(height, width, 4), dtype=np.uint8)
+        sprite[:, :, 3] = np.where(inside, 255, 0)
+        sprites.append(sprite)
+    return sprites
+
+
+def random_boxes(count, seed=0):
+    '''
+    Build a (count, 5) float32 array of YOLO boxes inside the unit square.
+    '''
+    rng = np.random.default_rng(seed)
+    boxes = np.empty((count, 5), dtype=np.float32)
+    boxes[:, 0] = 0
+    boxes[:, 1:3] = rng.uniform(0.05, 0.95, size=(count, 2))
+    boxes[:, 3:] = rng.uniform(0.001, 0.1, size=(count, 2))
+    return boxes
+
+
+def random_canvas(width, height, seed=0):
+    '''
+    Build a smooth (H, W, 3) uint8 background, compressing like a photo rather than noise.
+    '''
+    rng = np.random.default_rng(seed)
+    coarse = rng.integers(0, 255, size=(height // 32 + 1, width // 32 + 1, 3), dtype=np.uint8)
+    canvas = cv2.resize(coarse, (width, height), interpolation=cv2.INTER_CUBIC)
+    grain = rng.integers(-8, 9, size=canvas.shape)
+    return np.clip(canvas.astype(np.int16) + grain, 0, 255).astype(np.uint8)
+
+
+def write_canvases(output_folder, count, size=(1280, 720), seed=0):
+    '''
+    Write count random canvases as PNG files and return their paths.
+    '''
+    os.makedirs(output_folder, exist_ok=True)
+    paths = []
+    for i in range(count):
+        path = os.path.join(output_folder, f"canvas_{i:03d}.png")
+        Image.fromarray(random_canvas(*size, seed=seed + i)).save(path)
+        paths.append(path)
+    return paths
+
+
+def write_sprites(output_folder, count, size=(320, 240), seed=0):
+    '''
+    Write count green-screen clip-art images and return their paths.
+    '''
+    os.makedirs(output_folder, exist_ok=True)
+    paths = []
+    for i in range(count):
+        path = os.path.join(output_folder, f"sprite_{i:03d}.png")
+        green_screen_sprite(*size, seed=seed + i).save(path)
+        paths.append(path)
+    return paths
+
+
+def write_video(output_folder, name='video_01', frames=120, size=(640, 360), blank_every=10, seed=0):
+    '''
+    Write a short MJPG video with a moving box and its Drone-vs-Bird annotation file.
+
+    Every blank_every-th frame is black, for the blank-frame benchmarks.
+    Returns the video file name.
+    '''
+    os.makedirs(output_folder, exist_ok=True)
+    width, height = size
+    rng = np.random.default_rng(seed)
+    background = random_canvas(width, height, seed=seed)
+
+    file_name = f"{name}.avi"
+    writer = cv2.VideoWriter(os.path.join(output_folder, file_name), cv2.VideoWriter_fourcc(*'MJPG'), 30, size)
+    lines = []
+    for frame_number in range(frames):
+        if blank_every and frame_number % blank_every == 0:
+            writer.write(np.zeros((height, width, 3), dtype=np.uint8))
+            lines.append(f"{frame_number} 0\n")
+            continue
+        frame = background.copy()
+        box_w, box_h = rng.integers(10, 60, size=2)
+        x = int((frame_number * 5) % (width - box_w))
+        y = int(rng.integers(0, height - box_h))
+        frame[y:y + box_h, x:x + box_w] = (30, 30, 30)
+        writer.write(frame)
+        lines.append(f"{frame_number} 1 {x} {y} {box_w} {box_h} drone\n")
+    writer.release()
+
+    with open(os.path.join(output_folder, f"{name}.txt"), 'w') as ann_file:
+        ann_file.write("".join(lines))
+    return file_name
+
+
+def write_label_dir(root, total_boxes, boxes_per_file=10, videos=20, splits=('train', 'val', 'test'), seed=0):
+    '''
+    Write YOLO label files holding total_boxes boxes under root/<split>/<video>_frame_<n>.txt.
+
+    Every 12th file is left empty, like frames without objects. Returns the number of files.
+    '''
+    rng = np.random.default_rng(seed)
+    boxes = random_boxes(total_boxes, seed=seed)
+    per_file = rng.integers(1, 2 * boxes_per_file, size=total_boxes // max(boxes_per_file, 1) + 1)
+    ends = np.cumsum(per_file)
+    ends = np.append(ends[ends < total_boxes], total_boxes)
+    starts = np.concatenate([[0], ends[:-1]])
+
+    for split in splits:
+        os.makedirs(os.path.join(root, split), exist_ok=True)
+    count = 0
+    for idx, (start, end) in enumerate(zip(starts.tolist(), ends.tolist())):
+        split = splits[idx % len(splits)]
+        video = f"video_{(idx // len(splits)) % videos:02d}"
+        frame = idx // (len(splits) * videos)
+        path = os.path.join(root, split, f"{video}_frame_{frame:04d}.txt")
+        if idx % 12 == 11:
+            open(path, 'w').close()
+        else:
+            lines = [f"0 {x:.6f} {y:.6f} {w:.6f} {h:.6f}\n" for _, x, y, w, h in boxes[start:end].tolist()]
+            with open(path, 'w') as label_file:
+                label_file.write("".join(lines))
+        count += 1
+    return count
+
+
+def write_image_dir(root, count, size=(1280, 720), boxes_per_image=4, blank_every=8, seed=0):
+    '''
+    Write count PNG frames with same-named YOLO label files, some of them blank.
+
+    Returns the image paths.
+    '''
+    os.makedirs(root, exist_ok=True)
+    paths = []
+    for i in range(count):
+        base = os.path.join(root, f"video_00_frame_{i:04d}")
+        if blank_every and i % blank_every == 0:
+            img = np.zeros((size[1], size[0], 3), dtype=np.uint8)
+        else:
+            img = random_canvas(*size, seed=seed + i)
+        cv2.imwrite(base + '.png', img)
+        lines = [f"0 {x:.6f} {y:.6f} {w:.6f} {h:.6f}\n"
+                 for _, x, y, w, h in random_boxes(boxes_per_image, seed=seed + i).tolist()]
+        with open(base + '.txt', 'w') as label_file:
+            label_file.write("".join(lines))
+        paths.append(base + '.png')
+    return paths
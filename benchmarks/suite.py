@@ -0,0 +1,475 @@
+'''
+Benchmark suite for src.utils: public functions plus end-to-end generation.
+
+All fixtures are generated locally (benchmarks.fixtures), nothing is
+downloaded and VTK only renders off-screen, so it runs on a headless,
+CPU-only box. Results are saved as JSON and can be compared against a
+saved baseline. Run from the repository root:
+    python -m benchmarks.suite --out results.json
+    python -m benchmarks.suite --scale full --boxes 1000000 --out results.json
+    python -m benchmarks.suite --baseline baseline.json --fail-on-regression
+    python -m benchmarks.suite --list
+'''
+import argparse
+import fnmatch
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from src.utils import diversity, files, geometry, image_data, label_data, synth, video_data
+
+from . import fixtures
+
+SCALES = {
+    'quick': {'boxes': 10_000, 'frames': 60, 'images': 12, 'generate': 8, 'repeat': 3},
+    'full': {'boxes': 100_000, 'frames': 300, 'images': 48, 'generate': 64, 'repeat': 5},
+}
+
+CASES = {}
+
+
+def case(name, repeat=None):
+    '''
+    Register a benchmark. The function builds its inputs from the fixtures and
+    returns the callable that is timed.
+    '''
+    def register(setup):
+        CASES[name] = (setup, repeat)
+        return setup
+    return register
+
+
+class Fixtures:
+    '''
+    Lazily built fixtures shared by all cases, under one temporary root.
+    '''
+    def __init__(self, root, params):
+        self.root = root
+        self.params = params
+        self._built = {}
+
+    def get(self, key, build):
+        if key not in self._built:
+            self._built[key] = build()
+        return self._built[key]
+
+    def path(self, *parts):
+        return os.path.join(self.root, *parts)
+
+    def scratch(self):
+        # Fresh output directory for cases that write files
+        return tempfile.mkdtemp(dir=self.root, prefix='out_')
+
+    @property
+    def stl(self):
+        return self.get('stl', lambda: fixtures.write_stl(self.path('drone.stl')))
+
+    @property
+    def model(self):
+        return self.get('model', lambda: synth.load_3d_model(self.stl))
+
+    @property
+    def canvases(self):
+        return self.get('canvases', lambda: fixtures.write_canvases(self.path('canvases'), 4))
+
+    @property
+    def sprites(self):
+        return self.get('sprites', lambda: fixtures.write_sprites(self.path('sprites'), 4))
+
+    @property
+    def cutouts(self):
+        def build():
+            self.sprites
+            return synth.matte_directory(self.path('sprites'), self.path('cutouts'))
+        return self.get('cutouts', build)
+
+    @property
+    def video(self):
+        return self.get('video', lambda: fixtures.write_video(self.path('videos'), frames=self.params['frames']))
+
+    @property
+    def labels(self):
+        def build():
+            fixtures.write_label_dir(self.path('labels'), self.params['boxes'])
+            return self.path('labels')
+        return self.get('labels', build)
+
+    @property
+    def images(self):
+        return self.get('images', lambda: fixtures.write_image_dir(self.path('images'), self.params['images']))
+
+
+# synth
+
+@case('synth.load_3d_model')
+def bench_load_3d_model(fx):
+    return lambda: synth.load_3d_model(fx.stl)
+
+
+@case('synth.RenderContext.render', repeat=3)
+def bench_render(fx):
+    ctx = synth.RenderContext()
+    model = fx.model
+    return lambda: [ctx.render(model, randomize=True, seed=seed, as_array=True) for seed in range(2)]
+
+
+@case('synth.rasterize_mesh')
+def bench_rasterize_mesh(fx):
+    mesh = synth.mesh_arrays(fx.model)
+    poses = [synth.random_pose(randomize=True, seed=seed) for seed in range(20)]
+    return lambda: [synth.rasterize_mesh(mesh, (0, -90, 0), pose, color, 40, as_array=True) for color, pose in poses]
+
+
+@case('synth.chroma_key')
+def bench_chroma_key(fx):
+    sprite = fixtures.green_screen_sprite(1024, 768)
+    return lambda: synth.chroma_key(sprite, soft=True, despill=True, as_array=True)
+
+
+@case('synth.object_mask+object_alpha')
+def bench_object_alpha(fx):
+    sprite = fixtures.green_screen_sprite(1024, 768)
+    return lambda: synth.object_alpha(sprite, synth.object_mask(sprite))
+
+
+@case('synth.rng_transform')
+def bench_rng_transform(fx):
+    from PIL import Image
+    sprites = [Image.fromarray(sprite, 'RGBA') for sprite in fixtures.random_sprites(20)]
+    return lambda: [synth.rng_transform(sprite, seed=seed) for seed, sprite in enumerate(sprites)]
+
+
+@case('synth.augment_batch')
+def bench_augment_batch(fx):
+    sprite = fixtures.random_sprites(1, seed=3)[0]
+    sprites = np.stack([sprite] * 64)
+    return lambda: synth.augment_batch(sprites, list(range(64)), [3] * 64)
+
+
+@case('synth.scale_obj')
+def bench_scale_obj(fx):
+    from PIL import Image
+    sprites = [Image.fromarray(sprite, 'RGBA') for sprite in fixtures.random_sprites(20)]
+    return lambda: [synth.scale_obj(sprite, 0.05, (1920, 1080)) for sprite in sprites]
+
+
+@case('synth.composite')
+def bench_composite(fx):
+    canvas = fixtures.random_canvas(1920, 1080)
+    sprites = fixtures.random_sprites(5)
+    placements = [(sprite, (100 + 300 * i, 200 + 100 * i)) for i, sprite in enumerate(sprites)]
+    return lambda: synth.composite(canvas.copy(), placements)
+
+
+@case('synth.plan_placements')
+def bench_plan_placements(fx):
+    return lambda: synth.plan_placements(10_000, 100, 10, seed=0)
+
+
+@case('synth.generate_dataset[clip_art]', repeat=2)
+def bench_generate_clip_art(fx):
+    spec = {'kind': 'clip_art', 'canvases': fx.canvases, 'objects': fx.cutouts}
+    return lambda: synth.generate_dataset(spec, fx.params['generate'], fx.scratch(), workers=1)
+
+
+@case('synth.generate_dataset[clip_art,pool]', repeat=2)
+def bench_generate_clip_art_pool(fx):
+    spec = {'kind': 'clip_art', 'canvases': fx.canvases, 'objects': fx.cutouts}
+    return lambda: synth.generate_dataset(spec, fx.params['generate'] * 2, fx.scratch(), workers=2)
+
+
+@case('synth.generate_dataset[3d_model,raster]', repeat=2)
+def bench_generate_raster(fx):
+    spec = {'kind': '3d_model', 'canvases': fx.canvases, 'objects': [fx.stl], 'renderer': 'raster'}
+    return lambda: synth.generate_dataset(spec, fx.params['generate'], fx.scratch(), workers=1)
+
+
+@case('synth.generate_dataset[clip_art,tiles]', repeat=2)
+def bench_generate_tiles(fx):
+    spec = {'kind': 'clip_art', 'canvases': fx.canvases, 'objects': fx.cutouts, 'output': 'tiles'}
+    return lambda: synth.generate_dataset(spec, fx.params['generate'], fx.scratch(), workers=1)
+
+
+# label_data and geometry
+
+@case('label_data.convert_annotations')
+def bench_convert_annotations(fx):
+    video_dir = os.path.dirname(fx.path('videos', fx.video))
+    return lambda: label_data.convert_annotations(fx.video, video_dir, fx.scratch(), 640, 360)
+
+
+@case('label_data.read_bbox_array')
+def bench_read_bbox_array(fx):
+    split_dir = os.path.join(fx.labels, 'train')
+    paths = [os.path.join(split_dir, name) for name in sorted(os.listdir(split_dir))[:500]]
+    return lambda: [label_data.read_bbox_array(path) for path in paths]
+
+
+@case('label_data.tile_boxes')
+def bench_tile_boxes(fx):
+    boxes = fixtures.random_boxes(fx.params['boxes'])
+    tiles = image_data.tile_grid(1920, 1080, rows=3, cols=3) / np.array([1920, 1080, 1920, 1080])
+    return lambda: label_data.tile_boxes(boxes, tiles)
+
+
+@case('label_data.LabelIndex.update[cold]', repeat=2)
+def bench_label_index_cold(fx):
+    root = fx.labels
+    return lambda: label_data.LabelIndex(root).update()
+
+
+@case('label_data.LabelIndex.update[warm]')
+def bench_label_index_warm(fx):
+    index_file = os.path.join(fx.scratch(), 'index.npz')
+    label_data.LabelIndex(fx.labels, index_file=index_file).update()
+    return lambda: label_data.LabelIndex(fx.labels, index_file=index_file).update()
+
+
+@case('label_data.LabelIndex.split_stats')
+def bench_label_index_stats(fx):
+    index = label_data.LabelIndex(fx.labels).update()
+    return lambda: (index.split_stats(), index.counts_per_video(), index.frames_per_video())
+
+
+@case('geometry.convert+area+clip')
+def bench_geometry(fx):
+    boxes = fixtures.random_boxes(fx.params['boxes'])
+    return lambda: geometry.filter_area(geometry.clip(geometry.convert(boxes, 'yolo', 'xyxy'), 'xyxy'), 1e-4, fmt='xyxy')
+
+
+@case('geometry.iou')
+def bench_iou(fx):
+    boxes = fixtures.random_boxes(4000)
+    return lambda: geometry.iou(boxes[:2000], boxes[2000:])
+
+
+# image_data
+
+@case('image_data.tile_image')
+def bench_tile_image(fx):
+    image_path = fx.images[1]
+    label_path = os.path.splitext(image_path)[0] + '.txt'
+    return lambda: image_data.tile_image(image_path, fx.scratch(), label_path, min_size=0)
+
+
+@case('image_data.is_blank_image')
+def bench_is_blank_image(fx):
+    return lambda: [image_data.is_blank_image(path) for path in fx.images]
+
+
+@case('image_data.scan_blank_images[cold]')
+def bench_scan_blank(fx):
+    return lambda: image_data.scan_blank_images(fx.images, index_file=os.path.join(fx.scratch(), 'blank.json'))
+
+
+@case('image_data.scan_blank_images[warm]')
+def bench_scan_blank_warm(fx):
+    index_file = os.path.join(fx.scratch(), 'blank.json')
+    image_data.scan_blank_images(fx.images, index_file=index_file)
+    return lambda: image_data.scan_blank_images(fx.images, index_file=index_file)
+
+
+# video_data
+
+@case('video_data.extract_frames[png]', repeat=2)
+def bench_extract_png(fx):
+    video_dir = fx.path('videos')
+    fx.video
+    return lambda: video_data.extract_frames(fx.video, video_dir, fx.scratch(), codec='png')
+
+
+@case('video_data.extract_frames[jpg,blank]', repeat=2)
+def bench_extract_jpg(fx):
+    video_dir = fx.path('videos')
+    fx.video
+    return lambda: video_data.extract_frames(fx.video, video_dir, fx.scratch(), codec='jpg', blank_threshold=10)
+
+
+@case('video_data.probe_resolution')
+def bench_probe(fx):
+    video_dir = fx.path('videos')
+    fx.video
+
+    def probe():
+        video_data._probe_cache.clear()
+        return video_data.probe_resolution(fx.video, video_dir)
+    return probe
+
+
+# files and diversity
+
+@case('files.DatasetCatalog.refresh[cold]', repeat=2)
+def bench_catalog_cold(fx):
+    root = fx.labels
+    return lambda: files.DatasetCatalog(root, db_path=os.path.join(fx.scratch(), 'catalog.sqlite')).refresh()
+
+
+@case('files.DatasetCatalog.pairs')
+def bench_catalog_pairs(fx):
+    fx.images
+    catalog = files.DatasetCatalog(fx.path('images'), db_path=os.path.join(fx.scratch(), 'catalog.sqlite'))
+    catalog.refresh()
+    return lambda: catalog.pairs()
+
+
+@case('files.stage_split[hardlink]')
+def bench_stage_split(fx):
+    import pandas as pd
+    df = pd.DataFrame({'img_path': fx.images, 'ann_path': [os.path.splitext(p)[0] + '.txt' for p in fx.images]})
+    return lambda: files.stage_split(df, mode='hardlink', staging_dir=fx.scratch())
+
+
+@case('files.plan_blends')
+def bench_plan_blends(fx):
+    import pandas as pd
+    manifests = {
+        name: pd.DataFrame({'img_path': [f"{name}/{i}.png" for i in range(size)],
+                            'ann_path': [f"{name}/{i}.txt" for i in range(size)]})
+        for name, size in (('baseline', 20000), ('3d_model', 10000), ('clipart', 10000), ('genai', 5000))
+    }
+    combinations = np.random.default_rng(0).dirichlet(np.ones(4), size=30).round(2)
+    return lambda: files.plan_blends(manifests, combinations, seed=0)
+
+
+@case('files.CanvasCache.get[warm]')
+def bench_canvas_cache(fx):
+    cache = files.CanvasCache(cache_dir=fx.scratch())
+    for path in fx.canvases:
+        cache.get(path)
+    return lambda: [cache.get(path) for path in fx.canvases]
+
+
+@case('files.pack_shards')
+def bench_pack_shards(fx):
+    fx.images
+    return lambda: files.pack_shards(fx.path('images'), fx.scratch())
+
+
+@case('files.ShardReader.stream')
+def bench_shard_stream(fx):
+    fx.images
+    reader_dir = fx.scratch()
+    files.pack_shards(fx.path('images'), reader_dir)
+    return lambda: sum(1 for _ in files.ShardReader(reader_dir).stream(shuffle_buffer=64))
+
+
+@case('diversity.StreamingMoments.update')
+def bench_moments(fx):
+    features = np.random.default_rng(0).standard_normal((2048, 1920)).astype(np.float32)
+    return lambda: diversity.StreamingMoments().update(features[:1024]).update(features[1024:]).total_variance()
+
+
+def run_case(name, fx, repeat):
+    setup, case_repeat = CASES[name]
+    func = setup(fx)
+    func()  # warm-up, also builds any lazily created state
+    times = []
+    for _ in range(case_repeat or repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return {
+        'min': min(times),
+        'median': statistics.median(times),
+        'mean': statistics.fmean(times),
+        'rounds': len(times),
+    }
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = ''
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'commit': commit,
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+
+
+def compare(results, baseline, tolerance):
+    '''
+    Compare medians against a baseline. Returns the lines of the report and the regressed cases.
+    '''
+    lines, regressions = [], []
+    for name, result in results.items():
+        before = baseline.get('results', {}).get(name)
+        if 'median' not in result or not before or 'median' not in before:
+            continue
+        ratio = result['median'] / before['median']
+        status = 'slower' if ratio > 1 + tolerance else 'faster' if ratio < 1 - tolerance else ''
+        if status == 'slower':
+            regressions.append(name)
+        lines.append(f"{name:44s} {before['median'] * 1e3:10.2f} ms -> {result['median'] * 1e3:10.2f} ms  {ratio:6.2f}x {status}")
+    return lines, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', choices=sorted(SCALES), default='quick')
+    parser.add_argument('--boxes', type=int, help='boxes in the label directory fixture (10k to 1M)')
+    parser.add_argument('--repeat', type=int, help='timed rounds per case')
+    parser.add_argument('--filter', action='append', help='glob of case names to run, may be repeated')
+    parser.add_argument('--out', help='write results to this JSON file')
+    parser.add_argument('--baseline', help='compare against this results JSON file')
+    parser.add_argument('--tolerance', type=float, default=0.15, help='relative change reported as slower/faster')
+    parser.add_argument('--fail-on-regression', action='store_true')
+    parser.add_argument('--keep', action='store_true', help='keep the fixture directory')
+    parser.add_argument('--list', action='store_true')
+    args = parser.parse_args()
+
+    names = [name for name in CASES if not args.filter or any(fnmatch.fnmatch(name, f) for f in args.filter)]
+    if args.list:
+        print("\n".join(names))
+        return
+
+    params = dict(SCALES[args.scale])
+    if args.boxes:
+        params['boxes'] = args.boxes
+    repeat = args.repeat or params['repeat']
+
+    root = tempfile.mkdtemp(prefix='utils_bench_')
+    fx = Fixtures(root, params)
+    results = {}
+    try:
+        for name in names:
+            try:
+                results[name] = run_case(name, fx, repeat)
+                print(f"{name:44s} {results[name]['median'] * 1e3:10.2f} ms")
+            except Exception as e:
+                # Keep going, e.g. when VTK cannot open an off-screen context on this box
+                results[name] = {'error': repr(e)}
+                print(f"{name:44s} skipped: {e!r}")
+    finally:
+        if not args.keep:
+            shutil.rmtree(root, ignore_errors=True)
+
+    report = {'environment': environment(), 'params': params, 'results': results}
+    if args.out:
+        with open(args.out, 'w') as out_file:
+            json.dump(report, out_file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, 'r') as baseline_file:
+            baseline = json.load(baseline_file)
+        lines, regressions = compare(results, baseline, args.tolerance)
+        print("\n" + "\n".join(lines))
+        if regressions and args.fail_on_regression:
+            print(f"{len(regressions)} regressions over {args.tolerance:.0%}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,12 +1,19 @@
-
 RAW_DATA_DIR = 'data\\raw'
 INTERIM_DATA_DIR = 'data\\interim'
 PROCESSED_DATA_DIR = 'data\\processed'
 METADATA_DIR = 'data\\metadata'
 EXTERNAL_DATA_DIR = 'data\\external'
 
-from . import label_data
-from . import video_data
-from . import files
-from . import image_data
-from . import synth
\ No newline at end of file
+import importlib
+
+# Submodules are imported on first access (utils.synth, ...), so a worker that
+# only needs label_data or files does not pay for vtk, cv2 or google.genai
+_submodules = ('label_data', 'video_data', 'files', 'geometry', 'image_data', 'synth', 'diversity')
+
+def __getattr__(name):
+    if name in _submodules:
+        return importlib.import_module(f".{name}", __name__)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def __dir__():
+    return sorted(set(globals()) | set(_submodules))
@@ -0,0 +1,198 @@
+import os
+import hashlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+
+class StreamingMoments:
+    '''
+    Running mean and (co)variance of feature vectors, updated batch by batch.
+
+    Batches are merged with the parallel form of Welford's algorithm, so the
+    statistics are exact without holding all features in memory. With
+    full_covariance=False only the per-dimension variances are tracked,
+    which is all total_variance needs.
+    '''
+    def __init__(self, full_covariance=False):
+        self.full_covariance = full_covariance
+        self.count = 0
+        self.mean = None
+        self.m2 = None
+
+    def update(self, batch):
+        '''
+        Add a (B, D) batch of feature vectors.
+        '''
+        batch = np.asarray(batch, dtype=np.float64).reshape(len(batch), -1)
+        batch_count = len(batch)
+        if batch_count == 0:
+            return self
+
+        batch_mean = batch.mean(axis=0)
+        centered = batch - batch_mean
+        batch_m2 = centered.T @ centered if self.full_covariance else (centered ** 2).sum(axis=0)
+
+        if self.count == 0:
+            self.count, self.mean, self.m2 = batch_count, batch_mean, batch_m2
+            return self
+
+        # Merge the batch moments into the running moments
+        total = self.count + batch_count
+        delta = batch_mean - self.mean
+        self.mean = self.mean + delta * (batch_count / total)
+        if self.full_covariance:
+            self.m2 = self.m2 + batch_m2 + np.outer(delta, delta) * (self.count * batch_count / total)
+        else:
+            self.m2 = self.m2 + batch_m2 + delta ** 2 * (self.count * batch_count / total)
+        self.count = total
+        return self
+
+    def covariance(self, ddof=1):
+        '''
+        Get the covariance matrix (full_covariance) or per-dimension variances.
+        '''
+        return self.m2 / (self.count - ddof)
+
+    def total_variance(self, ddof=1):
+        '''
+        Get the trace of the covariance matrix, as torch.trace(torch.cov(X.T)).
+        '''
+        m2 = np.diag(self.m2) if self.full_covariance else self.m2
+        return float(m2.sum() / (self.count - ddof))
+
+
+class EmbeddingCache:
+    '''
+    On-disk cache of image embeddings keyed by the image content hash.
+
+    Entries live under cache_dir/<model_key>/<first two hex digits>/, so
+    images shared between data blends are only embedded once per model.
+    '''
+    def __init__(self, cache_dir, model_key):
+        self.root = os.path.join(cache_dir, model_key)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, digest):
+        path = self._path(digest)
+        if os.path.exists(path):
+            self.hits += 1
+            return np.load(path)
+        self.misses += 1
+        return None
+
+    def put(self, digest, embedding):
+        path = self._path(digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp.npy"
+        np.save(tmp_path, embedding)
+        os.replace(tmp_path, path)
+
+    def _path(self, digest):
+        return os.path.join(self.root, digest[:2], digest + '.npy')
+
+
+def load_image(image_path):
+    '''
+    Read an image file once, returning its content hash and decoded BGR array.
+    '''
+    with open(image_path, 'rb') as image_file:
+        data = image_file.read()
+    digest = hashlib.sha1(data).hexdigest()
+    img = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    return digest, img
+
+
+def prefetch_batches(image_paths, batch_size=16, prefetch=2, workers=4):
+    '''
+    Yield lists of (path, digest, image) with the next batches decoded in the background.
+    '''
+    batches = [image_paths[i:i + batch_size] for i in range(0, len(image_paths), batch_size)]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for batch in batches:
+            pending.append((batch, [executor.submit(load_image, path) for path in batch]))
+            # Keep at most `prefetch` batches decoding ahead of the consumer
+            if len(pending) > prefetch:
+                paths, futures = pending.popleft()
+                yield [(path, *future.result()) for path, future in zip(paths, futures)]
+        while pending:
+            paths, futures = pending.popleft()
+            yield [(path, *future.result()) for path, future in zip(paths, futures)]
+
+
+def embed_images(model, image_paths, layers=(10, 14, 17), batch_size=16, cache=None, device='cpu', prefetch=2, workers=4):
+    '''
+    Yield (path, embedding) pairs for the images, running the model in batches.
+
+    Embeddings found in the cache (an EmbeddingCache) are reused, new ones
+    are stored in it. Each predict call only gets images of one shape, as
+    the model letterboxes a mixed batch differently, so an embedding does
+    not depend on the images it was batched with. Raises ValueError for an
+    image that cannot be decoded, rather than computing the metric on fewer
+    images.
+    '''
+    for batch in prefetch_batches(image_paths, batch_size=batch_size, prefetch=prefetch, workers=workers):
+        embeddings = {}
+        todo = {}
+        for path, digest, img in batch:
+            cached = cache.get(digest) if cache is not None else None
+            if cached is not None:
+                embeddings[path] = cached
+            elif img is None:
+                raise ValueError(f"Could not decode image {path}")
+            else:
+                todo.setdefault(img.shape, []).append((path, digest, img))
+
+        for group in todo.values():
+            results = model.predict([img for _, _, img in group], embed=list(layers), device=device, verbose=False)
+            for (path, digest, _), result in zip(group, results):
+                embedding = result.detach().cpu().numpy().reshape(-1)
+                embeddings[path] = embedding
+                if cache is not None:
+                    cache.put(digest, embedding)
+
+        for path, _, _ in batch:
+            yield path, embeddings[path]
+
+
+def total_variance(model, image_paths, layers=(10, 14, 17), batch_size=16, cache_dir=None, model_key=None,
+                   device='cpu', prefetch=2, workers=4):
+    '''
+    Get the diversity metric (total variance of the image embeddings) for a set of images.
+
+    Equal to stacking every embedding and taking torch.trace(torch.cov(X.T)),
+    but accumulated batch by batch. If cache_dir is given, embeddings are
+    cached per image hash under model_key. The default key is the sha1 of
+    the model's checkpoint file plus the layers, so runs that all save
+    weights/best.pt never share embeddings. Without a checkpoint file,
+    model_key must be given.
+    '''
+    cache = None
+    if cache_dir is not None:
+        if model_key is None:
+            checkpoint = getattr(model, 'ckpt_path', None)
+            if not checkpoint or not os.path.isfile(checkpoint):
+                raise ValueError("model_key is required when the model has no checkpoint file")
+            digest = hashlib.sha1()
+            with open(checkpoint, 'rb') as checkpoint_file:
+                for block in iter(lambda: checkpoint_file.read(2**20), b''):
+                    digest.update(block)
+            model_key = f"{digest.hexdigest()[:16]}_{'-'.join(str(layer) for layer in layers)}"
+        cache = EmbeddingCache(cache_dir, model_key)
+
+    moments = StreamingMoments()
+    batch = []
+    for _, embedding in embed_images(model, image_paths, layers=layers, batch_size=batch_size, cache=cache,
+                                     device=device, prefetch=prefetch, workers=workers):
+        batch.append(embedding)
+        if len(batch) == batch_size:
+            moments.update(np.stack(batch))
+            batch = []
+    if batch:
+        moments.update(np.stack(batch))
+
+    return moments.total_variance()
@@ -1,5 +1,15 @@
 import os
 import shutil
+import hashlib
+import json
+import sqlite3
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from . import geometry
 
 def get_video_files(directory):
     '''
@@ -67,6 +77,82 @@ def copy_to_staging(df, stage='train'):
         shutil.copy(src_image_path, dest_image_path)
         shutil.copy(src_label_path, dest_label_path)
         
+def stage_split(dfs, stage='train', mode='hardlink', staging_dir=os.path.join('data', 'staging'), workers=16):
+    '''
+    Materialize a split in the staging directory from one or more manifests.
+
+    dfs is a dataframe (or list of dataframes) with 'img_path' and 'ann_path'
+    columns. mode is one of:
+    - 'hardlink' or 'symlink': link the files into staging/<stage>, falling
+      back to a copy where links are not possible (e.g. across devices)
+    - 'copy': copy the files as copy_to_staging does
+    - 'list': only write staging/<stage>.txt listing the image paths, YOLO
+      finds each label next to its image, nothing is copied
+    For the directory modes the previous contents are recorded in
+    staging/<stage>/.manifest.json, so only entries that changed are removed
+    or added, using a thread pool. Returns counts of added, removed and kept entries.
+    '''
+    if not isinstance(dfs, (list, tuple)):
+        dfs = [dfs]
+
+    # Normalize windows paths from the manifest csv files
+    images = [p.replace('\\', '/') for df in dfs for p in df['img_path'].tolist()]
+    labels = [p.replace('\\', '/') for df in dfs for p in df['ann_path'].tolist()]
+
+    os.makedirs(staging_dir, exist_ok=True)
+    if mode == 'list':
+        images = [os.path.abspath(p) for p in images]
+        list_path = os.path.join(staging_dir, f"{stage}.txt")
+        with open(list_path, 'w') as list_file:
+            list_file.write("\n".join(images) + "\n")
+        return {'added': len(images), 'removed': 0, 'kept': 0, 'list_file': list_path}
+    if mode not in ('hardlink', 'symlink', 'copy'):
+        raise ValueError(f"Unsupported staging mode: {mode}")
+
+    stage_dir = os.path.join(staging_dir, stage)
+    os.makedirs(stage_dir, exist_ok=True)
+    desired = {os.path.basename(src): os.path.abspath(src) for src in images + labels}
+
+    # Diff against what the last call staged, for entries still on disk
+    manifest_path = os.path.join(stage_dir, '.manifest.json')
+    previous = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, 'r') as manifest_file:
+            previous = json.load(manifest_file)
+    present = {entry.name for entry in os.scandir(stage_dir) if entry.name != '.manifest.json'}
+
+    kept = {name for name in present if previous.get(name) == [desired.get(name), mode]}
+    to_remove = [os.path.join(stage_dir, name) for name in present - kept]
+    to_add = [(src, os.path.join(stage_dir, name)) for name, src in desired.items() if name not in kept]
+
+    def add(item):
+        src, dest = item
+        try:
+            if mode == 'hardlink':
+                os.link(src, dest)
+                return
+            if mode == 'symlink':
+                os.symlink(src, dest)
+                return
+        except OSError:
+            pass
+        shutil.copy(src, dest)
+
+    def remove(path):
+        if os.path.isdir(path) and not os.path.islink(path):
+            shutil.rmtree(path)
+        else:
+            os.unlink(path)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(remove, to_remove))
+        list(executor.map(add, to_add))
+
+    with open(manifest_path, 'w') as manifest_file:
+        json.dump({name: [src, mode] for name, src in desired.items()}, manifest_file)
+
+    return {'added': len(to_add), 'removed': len(to_remove), 'kept': len(kept)}
+
 def cleanup_staging():
     '''
     Delete all files in the staging directories.
@@ -93,4 +179,775 @@ def cleanup_staging():
                 elif os.path.isdir(file_path):
                     shutil.rmtree(file_path)
             except Exception as e:
-                print(f'Failed to delete {file_path}. Reason: {e}')
\ No newline at end of file
+                print(f'Failed to delete {file_path}. Reason: {e}')
+
+def plan_blends(manifests, combinations, seed=0, plan_file=None):
+    '''
+    Sample every data blend of a DOE table from shared source manifests.
+
+    manifests maps each source name (e.g. baseline, 3d_model, clipart,
+    genai) to a manifest DataFrame or CSV path with 'img_path' and
+    'ann_path' columns, loaded once. combinations is the DOE table with one
+    row of source fractions per blend, in the order of manifests. As with
+    DataFrame.sample(frac=...), each blend takes round(frac * n) rows of each
+    source without replacement. All blends of a source are drawn in one
+    pass from a generator seeded by (seed, source index), so the plan is
+    reproducible. Returns a BlendPlan, saved to plan_file when given.
+    '''
+    import pandas as pd
+
+    sources = list(manifests)
+    frames = [pd.read_csv(m) if isinstance(m, str) else m for m in manifests.values()]
+    sizes = np.array([len(df) for df in frames], dtype=np.int64)
+    offsets = np.concatenate([[0], np.cumsum(sizes)])
+    img_paths = np.array([p.replace('\\', '/') for df in frames for p in df['img_path'].tolist()], dtype=str)
+    ann_paths = np.array([p.replace('\\', '/') for df in frames for p in df['ann_path'].tolist()], dtype=str)
+
+    fractions = np.asarray(combinations, dtype=np.float64).reshape(-1, len(sources))
+    counts = np.rint(fractions * sizes).astype(np.int64)
+
+    # Rank every row of a source once per blend, then keep each blend's first k
+    picks = [[] for _ in range(len(fractions))]
+    for s, size in enumerate(sizes):
+        rng = np.random.default_rng([seed, s])
+        order = np.argsort(rng.random((len(fractions), size)), axis=1) + offsets[s]
+        for b in range(len(fractions)):
+            picks[b].append(order[b, :counts[b, s]])
+
+    blends = [np.sort(np.concatenate(p)) for p in picks]
+    plan = BlendPlan()
+    plan.sources = np.array(sources, dtype=str)
+    plan.offsets = offsets
+    plan.img_paths = img_paths
+    plan.ann_paths = ann_paths
+    plan.fractions = fractions
+    plan.indices = np.concatenate(blends).astype(np.int32) if blends else np.empty(0, dtype=np.int32)
+    plan.indptr = np.concatenate([[0], np.cumsum([len(b) for b in blends])]).astype(np.int64)
+    if plan_file is not None:
+        plan.save(plan_file)
+    return plan
+
+class BlendPlan:
+    '''
+    Data blends stored as index arrays into one shared manifest.
+
+    The manifest holds every image and label path once, each blend is a
+    sorted slice of the flat indices array (blend b is
+    indices[indptr[b]:indptr[b + 1]]), so the blends of a whole DOE take
+    little more space than a single CSV. Blends are materialized on demand
+    as manifest DataFrames, path pairs or a staged split.
+    '''
+    def __init__(self, plan_file=None):
+        self.sources = np.array([], dtype=str)
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.img_paths = np.array([], dtype=str)
+        self.ann_paths = np.array([], dtype=str)
+        self.fractions = np.empty((0, 0), dtype=np.float64)
+        self.indices = np.empty(0, dtype=np.int32)
+        self.indptr = np.zeros(1, dtype=np.int64)
+
+        if plan_file is not None:
+            with np.load(plan_file) as plan:
+                for key in ('sources', 'offsets', 'img_paths', 'ann_paths', 'fractions', 'indices', 'indptr'):
+                    setattr(self, key, plan[key])
+
+    def __len__(self):
+        return len(self.fractions)
+
+    def save(self, plan_file):
+        '''
+        Save the plan to an .npz file.
+        '''
+        tmp_file = f"{plan_file}.{os.getpid()}.tmp.npz"
+        np.savez_compressed(tmp_file, sources=self.sources, offsets=self.offsets, img_paths=self.img_paths,
+                            ann_paths=self.ann_paths, fractions=self.fractions, indices=self.indices, indptr=self.indptr)
+        os.replace(tmp_file, plan_file)
+
+    def name(self, blend):
+        '''
+        Get the blend suffix used for model names, e.g. "28-0-36-35" for (0.29, 0, 0.36, 0.35).
+        '''
+        # Same truncation as the training notebook, so names match the trained models
+        return "-".join(str(int(fraction * 100)) for fraction in self.fractions[blend])
+
+    def blend_indices(self, blend):
+        '''
+        Get the manifest row indices of a blend.
+        '''
+        return self.indices[self.indptr[blend]:self.indptr[blend + 1]]
+
+    def source_counts(self, blend):
+        '''
+        Get the number of rows drawn from each source for a blend.
+        '''
+        counts = np.diff(np.searchsorted(self.blend_indices(blend), self.offsets))
+        return dict(zip(self.sources.tolist(), counts.tolist()))
+
+    def paths(self, blend):
+        '''
+        Iterate the (image, label) path pairs of a blend.
+        '''
+        for idx in self.blend_indices(blend).tolist():
+            yield str(self.img_paths[idx]), str(self.ann_paths[idx])
+
+    def manifest(self, blend):
+        '''
+        Get a blend as a manifest DataFrame with img_path, ann_path and source columns.
+        '''
+        import pandas as pd
+        idx = self.blend_indices(blend)
+        source = np.searchsorted(self.offsets, idx, side='right') - 1
+        return pd.DataFrame({
+            'img_path': self.img_paths[idx],
+            'ann_path': self.ann_paths[idx],
+            'source': self.sources[source],
+        })
+
+    def stage(self, blend, stage='train', **kwargs):
+        '''
+        Materialize a blend in the staging directory with stage_split.
+        '''
+        return stage_split(self.manifest(blend), stage=stage, **kwargs)
+
+class CanvasCache:
+    '''
+    Decoded background image store shared across processes.
+
+    Each background is decoded once into a raw RGB .npy file in cache_dir
+    and then memory-mapped copy-on-write, so every worker shares the same
+    page-cache pages and gets a private, writable array for compositing.
+    The store is kept under max_bytes by deleting the least recently used
+    files. Counters report decodes, map hits and the time spent in each.
+    '''
+    def __init__(self, cache_dir=None, max_bytes=2 * 2**30):
+        if cache_dir is None:
+            # Prefer shared memory so the raw store never touches disk
+            shm_dir = '/dev/shm'
+            base_dir = shm_dir if os.path.isdir(shm_dir) else tempfile.gettempdir()
+            cache_dir = os.path.join(base_dir, 'canvas_cache')
+        os.makedirs(cache_dir, exist_ok=True)
+
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.decodes = 0
+        self.map_seconds = 0.0
+        self.decode_seconds = 0.0
+
+    def get(self, image_path):
+        '''
+        Get a writable copy-on-write (H, W, 3) uint8 array of an image.
+        '''
+        raw_path = self._raw_path(image_path)
+
+        start = time.perf_counter()
+        try:
+            arr = np.load(raw_path, mmap_mode='c')
+        except (FileNotFoundError, ValueError):
+            arr = None
+        if arr is not None:
+            self.hits += 1
+            self.map_seconds += time.perf_counter() - start
+            # Mark as recently used for eviction, another process may have just evicted it
+            try:
+                os.utime(raw_path)
+            except OSError:
+                pass
+            return arr
+
+        # Decode once and publish atomically, other processes may race us
+        from PIL import Image
+        with Image.open(image_path) as img:
+            decoded = np.asarray(img.convert('RGB'))
+        tmp_path = f"{raw_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as raw_file:
+            np.save(raw_file, decoded)
+        os.replace(tmp_path, raw_path)
+        self.decodes += 1
+        self.decode_seconds += time.perf_counter() - start
+
+        try:
+            arr = np.load(raw_path, mmap_mode='c')
+        except (FileNotFoundError, ValueError):
+            # Evicted by another process before we mapped it
+            arr = decoded.copy()
+        self.evict(keep=raw_path)
+        return arr
+
+    def evict(self, keep=None):
+        '''
+        Delete least recently used raw images until the store fits max_bytes.
+
+        The keep path is never deleted, so a canvas larger than max_bytes
+        is still served from the store.
+        '''
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith('.npy'):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    # Evicted by another process while scanning
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                # Processes that already mapped the file keep their mapping
+                os.unlink(path)
+                total -= size
+            except OSError:
+                pass
+
+    def stats(self):
+        '''
+        Get the load counters for the cache.
+        '''
+        return {
+            'hits': self.hits,
+            'decodes': self.decodes,
+            'map_seconds': self.map_seconds,
+            'decode_seconds': self.decode_seconds,
+        }
+
+    def _raw_path(self, image_path):
+        # Key on path, size and mtime so an edited background is decoded again
+        stat = os.stat(image_path)
+        key = f"{os.path.abspath(image_path)}|{stat.st_size}|{stat.st_mtime_ns}"
+        return os.path.join(self.cache_dir, hashlib.sha1(key.encode()).hexdigest()[:20] + '.npy')
+
+_canvas_cache = None
+
+def canvas_cache(cache_dir=None, max_bytes=2 * 2**30):
+    '''
+    Get the canvas cache for the current process, creating it on first use.
+    '''
+    global _canvas_cache
+    if _canvas_cache is None or (cache_dir is not None and _canvas_cache.cache_dir != cache_dir):
+        _canvas_cache = CanvasCache(cache_dir=cache_dir, max_bytes=max_bytes)
+    _canvas_cache.max_bytes = max_bytes
+    return _canvas_cache
+
+class DatasetCatalog:
+    '''
+    SQLite index of the image, label, video and 3D model files under a data root.
+
+    The root is walked once with os.scandir and every file is recorded with
+    its size, mtime and a sha1 content hash, plus columns derived from its
+    path relative to root:
+    - source: the first sub-directory (e.g. drone_vs_bird_data)
+    - split: the nearest parent directory named train, val or test
+    - video and frame: from "<video>_frame_<n>" names, as in LabelIndex
+    Images are paired with the label file of the same stem in the same
+    directory. refresh only hashes new or modified files and drops deleted
+    ones, and queries are answered from the database without touching the
+    data directories.
+    '''
+    kinds = {
+        'image': ('.png', '.jpg', '.jpeg', '.gif', '.bmp'),
+        'label': ('.txt',),
+        'annotation': ('.xml', '.json'),
+        'video': ('.mp4', '.avi', '.mov', '.mkv', '.mpg'),
+        'model': ('.obj', '.fbx', '.stl'),
+    }
+    splits = ('train', 'val', 'test')
+
+    def __init__(self, root, db_path=None):
+        self.root = root
+        self.db_path = db_path or os.path.join(root, '.catalog.sqlite')
+        self.conn = sqlite3.connect(self.db_path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY, dir TEXT, stem TEXT, name TEXT, kind TEXT,
+                source TEXT, split TEXT, video TEXT, frame INTEGER,
+                size INTEGER, mtime INTEGER, hash TEXT)
+        ''')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS files_pair ON files (dir, stem, kind)')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS files_filter ON files (kind, source, split, video)')
+        self.conn.commit()
+        self._ext_kinds = {ext: kind for kind, exts in self.kinds.items() for ext in exts}
+
+    def refresh(self, workers=8):
+        '''
+        Rescan the root, hashing only new or modified files. Returns the counts of
+        added, updated, removed and unchanged files.
+        '''
+        scanned = {}
+        for entry in self._scan(self.root):
+            stat = entry.stat()
+            scanned[os.path.relpath(entry.path, self.root).replace('\\', '/')] = (stat.st_size, stat.st_mtime_ns)
+
+        known = {path: (size, mtime) for path, size, mtime in self.conn.execute('SELECT path, size, mtime FROM files')}
+        removed = [path for path in known if path not in scanned]
+        changed = [path for path, stat in scanned.items() if known.get(path) != stat]
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            hashes = list(executor.map(self._hash, changed))
+
+        rows = [(path, *self._columns(path), *scanned[path], digest) for path, digest in zip(changed, hashes)]
+        with self.conn:
+            self.conn.executemany('DELETE FROM files WHERE path = ?', [(path,) for path in removed])
+            self.conn.executemany('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+
+        added = sum(path not in known for path in changed)
+        return {
+            'added': added,
+            'updated': len(changed) - added,
+            'removed': len(removed),
+            'unchanged': len(scanned) - len(changed),
+        }
+
+    def files(self, kind='image', source=None, split=None, video=None, names=None):
+        '''
+        Get the absolute paths of catalogued files of a kind, filtered by source,
+        split, video or names (substrings of the file name, as file_contains_name).
+        '''
+        where, params = self._filters('', kind, source, split, video, names)
+        rows = self.conn.execute(f'SELECT path FROM files WHERE {where} ORDER BY path', params)
+        return [os.path.join(self.root, path) for path, in rows]
+
+    def pairs(self, source=None, split=None, video=None, names=None, include_unlabeled=False):
+        '''
+        Get (image, label) path pairs matched by stem, with the same filters as files.
+        Images without a label are skipped unless include_unlabeled, then label is None.
+        '''
+        where, params = self._filters('i.', 'image', source, split, video, names)
+        join = 'LEFT JOIN' if include_unlabeled else 'JOIN'
+        rows = self.conn.execute(
+            f"SELECT i.path, l.path FROM files i {join} files l "
+            f"ON l.dir = i.dir AND l.stem = i.stem AND l.kind = 'label' "
+            f"WHERE {where} ORDER BY i.path", params)
+        return [(os.path.join(self.root, image), os.path.join(self.root, label) if label else None)
+                for image, label in rows]
+
+    def unpaired_labels(self, source=None, split=None):
+        '''
+        Get the label files without an image of the same stem.
+        '''
+        where, params = self._filters('l.', 'label', source, split, None, None)
+        rows = self.conn.execute(
+            f"SELECT l.path FROM files l WHERE {where} AND NOT EXISTS ("
+            f"SELECT 1 FROM files i WHERE i.dir = l.dir AND i.stem = l.stem AND i.kind = 'image') "
+            f"ORDER BY l.path", params)
+        return [os.path.join(self.root, path) for path, in rows]
+
+    def to_dataframe(self, **filters):
+        '''
+        Get the labelled pairs as a manifest DataFrame with img_path and ann_path
+        columns (as used by copy_to_staging and stage_split) plus source, split and video.
+        '''
+        import pandas as pd
+        pairs = self.pairs(**filters)
+        meta = {path: (source, split, video) for path, source, split, video in self.conn.execute(
+            "SELECT path, source, split, video FROM files WHERE kind = 'image'")}
+        rows = []
+        for image, label in pairs:
+            source, split, video = meta[os.path.relpath(image, self.root).replace('\\', '/')]
+            rows.append((image, label, source, split, video))
+        return pd.DataFrame(rows, columns=['img_path', 'ann_path', 'source', 'split', 'video'])
+
+    def close(self):
+        self.conn.close()
+
+    def _scan(self, directory):
+        # Iterative os.scandir walk yielding catalogued file entries
+        stack = [directory]
+        while stack:
+            with os.scandir(stack.pop()) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif os.path.splitext(entry.name)[1].lower() in self._ext_kinds:
+                        yield entry
+
+    def _columns(self, path):
+        # Derive dir, stem, name, kind, source, split, video and frame from a relative path
+        parts = path.split('/')
+        dirs, name = parts[:-1], parts[-1]
+        stem, ext = os.path.splitext(name)
+        split = next((part for part in reversed(dirs) if part in self.splits), '')
+        source = dirs[0] if dirs and dirs[0] != split else ''
+        video, sep, frame = stem.rpartition('_frame_')
+        if not (sep and frame.isdigit()):
+            video, frame = stem, -1
+        return '/'.join(dirs), stem, name, self._ext_kinds[ext.lower()], source, split, video, int(frame)
+
+    def _hash(self, path):
+        digest = hashlib.sha1()
+        with open(os.path.join(self.root, path), 'rb') as data_file:
+            for block in iter(lambda: data_file.read(2**20), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def _filters(self, prefix, kind, source, split, video, names):
+        clauses, params = [f'{prefix}kind = ?'], [kind]
+        for column, value in (('source', source), ('split', split), ('video', video)):
+            if value is not None:
+                clauses.append(f'{prefix}{column} = ?')
+                params.append(value)
+        if names:
+            clauses.append('(' + ' OR '.join(f'instr({prefix}name, ?) > 0' for _ in names) + ')')
+            params.extend(names)
+        return ' AND '.join(clauses), params
+
+class ShardWriter:
+    '''
+    Pack images and their YOLO labels into a few large shard files.
+
+    Image bytes are appended to shard_<n>.bin files, a new shard is started
+    once a shard holds shard_bytes. Images are stored as encoded files (the
+    original bytes when added from a path, so nothing is re-encoded) or as
+    raw RGB arrays with encoding='raw'. Labels are small, so all of them go
+    into the index as one (N, 5) array with a box_ptr row pointer (sample i
+    has boxes[box_ptr[i]:box_ptr[i + 1]]), next to each sample's name,
+    shard, offset, size, extension and raw shape. The label text is kept
+    too (label_ptr into the label_text bytes), as read from the label file
+    or written with full float precision for boxes given as arrays, so an
+    export reproduces the labels exactly, and has_label records which
+    samples had a label file at all. The index is written to index.npz on
+    close.
+    '''
+    def __init__(self, out_dir, shard_bytes=256 * 2**20, encoding=None):
+        if encoding not in (None, '.png', '.jpg', 'raw'):
+            raise ValueError(f"Unsupported shard encoding: {encoding}")
+        os.makedirs(out_dir, exist_ok=True)
+        self.out_dir = out_dir
+        self.shard_bytes = shard_bytes
+        self.encoding = encoding
+
+        self.shards = []
+        self.names = []
+        self.shard = []
+        self.offset = []
+        self.nbytes = []
+        self.exts = []
+        self.shapes = []
+        self.boxes = []
+        self.box_ptr = [0]
+        self.label_text = []
+        self.label_ptr = [0]
+        self.has_label = []
+        self._file = None
+        self._size = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return len(self.names)
+
+    def add(self, name, image, boxes=None, ext=None):
+        '''
+        Add a sample. image is an image file path, encoded bytes (with ext,
+        e.g. '.png') or an (H, W, 3) RGB uint8 array, boxes an (N, 5) YOLO array
+        or the path of a YOLO label file, None for a sample without one.
+        '''
+        label_text = None
+        if isinstance(boxes, str):
+            with open(boxes, 'rb') as label_file:
+                label_text = label_file.read()
+            boxes = None
+        self.append(name, *self.encode(image, ext), boxes, label_text)
+
+    def append(self, name, data, ext, shape, boxes=None, label_text=None):
+        '''
+        Add a sample from the stored bytes, extension and raw shape returned by
+        encode. label_text is the label file content, parsed when boxes is None.
+        With neither, the sample has no label file.
+        '''
+        if self._file is None or self._size >= self.shard_bytes:
+            self._next_shard()
+
+        self._file.write(data)
+        self.names.append(name)
+        self.shard.append(len(self.shards) - 1)
+        self.offset.append(self._size)
+        self.nbytes.append(len(data))
+        self.exts.append(ext)
+        self.shapes.append(shape)
+        self.has_label.append(boxes is not None or label_text is not None)
+        if boxes is None:
+            boxes = geometry.parse((label_text or b'').decode(), dtype=np.float64)
+        boxes = geometry.as_boxes(boxes, dtype=np.float64)
+        if label_text is None:
+            # repr keeps every digit of the floats
+            label_text = "".join(f"{int(c)} {a!r} {b!r} {w!r} {h!r}\n" for c, a, b, w, h in boxes.tolist()).encode()
+        self.boxes.append(boxes)
+        self.box_ptr.append(self.box_ptr[-1] + len(boxes))
+        self.label_text.append(label_text)
+        self.label_ptr.append(self.label_ptr[-1] + len(label_text))
+        self._size += len(data)
+
+    def encode(self, image, ext=None):
+        '''
+        Get the stored bytes, extension and raw shape of an image as add stores it.
+        '''
+        import cv2
+
+        if isinstance(image, str):
+            file_ext = os.path.splitext(image)[1].lower()
+            if self.encoding is None or self.encoding == file_ext:
+                with open(image, 'rb') as image_file:
+                    return image_file.read(), file_ext, (0, 0, 0)
+            image = cv2.cvtColor(cv2.imread(image, cv2.IMREAD_COLOR), cv2.COLOR_BGR2RGB)
+        elif isinstance(image, (bytes, bytearray, memoryview)):
+            if ext is None:
+                raise ValueError("ext is required for encoded image bytes")
+            return bytes(image), ext, (0, 0, 0)
+
+        image = np.ascontiguousarray(image, dtype=np.uint8)
+        if self.encoding == 'raw':
+            shape = image.shape if image.ndim == 3 else (*image.shape, 1)
+            return image.tobytes(), '', shape
+        ext = self.encoding or '.png'
+        bgr = cv2.cvtColor(image, cv2.COLOR_RGB2BGR) if image.ndim == 3 and image.shape[2] == 3 else image
+        ok, encoded = cv2.imencode(ext, bgr)
+        if not ok:
+            raise ValueError(f"Could not encode image as {ext}")
+        return encoded.tobytes(), ext, (0, 0, 0)
+
+    def close(self):
+        '''
+        Finish the last shard and write the index. Returns the index path.
+        '''
+        self._close_shard()
+        index_path = os.path.join(self.out_dir, 'index.npz')
+        tmp_file = f"{index_path}.{os.getpid()}.tmp.npz"
+        np.savez_compressed(
+            tmp_file,
+            shards=np.array(self.shards, dtype=str),
+            names=np.array(self.names, dtype=str),
+            shard=np.array(self.shard, dtype=np.int32),
+            offset=np.array(self.offset, dtype=np.int64),
+            nbytes=np.array(self.nbytes, dtype=np.int64),
+            exts=np.array(self.exts, dtype=str),
+            shapes=np.array(self.shapes, dtype=np.int32).reshape(-1, 3),
+            boxes=np.concatenate(self.boxes) if self.boxes else np.empty((0, 5)),
+            box_ptr=np.array(self.box_ptr, dtype=np.int64),
+            label_text=np.frombuffer(b"".join(self.label_text), dtype=np.uint8),
+            label_ptr=np.array(self.label_ptr, dtype=np.int64),
+            has_label=np.array(self.has_label, dtype=bool),
+        )
+        os.replace(tmp_file, index_path)
+        return index_path
+
+    def _next_shard(self):
+        self._close_shard()
+        name = f"shard_{len(self.shards):05d}.bin"
+        self.shards.append(name)
+        self._file = open(os.path.join(self.out_dir, f"{name}.tmp"), 'wb')
+        self._size = 0
+
+    def _close_shard(self):
+        # Shards only appear under their final name once complete
+        if self._file is None:
+            return
+        self._file.close()
+        self._file = None
+        name = self.shards[-1]
+        os.replace(os.path.join(self.out_dir, f"{name}.tmp"), os.path.join(self.out_dir, name))
+
+class ShardReader:
+    '''
+    Random and streaming access to a dataset written by ShardWriter.
+
+    Random access memory-maps the shards read-only, so a sample costs one
+    slice of the page cache and raw samples are returned without copying.
+    stream reads whole shards sequentially and can shuffle through a
+    buffer, for training loops over data larger than memory. Images are
+    returned as (H, W, 3) RGB uint8 arrays, labels as (N, 5) float arrays.
+    '''
+    def __init__(self, shard_dir):
+        self.shard_dir = shard_dir
+        with np.load(os.path.join(shard_dir, 'index.npz')) as index:
+            for key in ('shards', 'names', 'shard', 'offset', 'nbytes', 'exts', 'shapes', 'boxes', 'box_ptr',
+                        'label_text', 'label_ptr'):
+                setattr(self, key, index[key])
+            # Older indexes wrote a label file for every sample
+            self.has_label = index['has_label'] if 'has_label' in index else np.ones(len(self.names), dtype=bool)
+        self._maps = {}
+
+    def __len__(self):
+        return len(self.names)
+
+    def __getitem__(self, idx):
+        '''
+        Get the (name, image, boxes) of a sample.
+        '''
+        return str(self.names[idx]), self.image(idx), self.labels(idx)
+
+    def raw(self, idx):
+        '''
+        Get the stored bytes of a sample as a uint8 array view of its shard.
+        '''
+        shard = int(self.shard[idx])
+        if shard not in self._maps:
+            self._maps[shard] = np.memmap(os.path.join(self.shard_dir, str(self.shards[shard])), dtype=np.uint8, mode='r')
+        start = int(self.offset[idx])
+        return self._maps[shard][start:start + int(self.nbytes[idx])]
+
+    def labels(self, idx):
+        '''
+        Get the (N, 5) YOLO boxes of a sample, without touching the shards.
+        '''
+        return self.boxes[self.box_ptr[idx]:self.box_ptr[idx + 1]]
+
+    def label_file(self, idx):
+        '''
+        Get the YOLO label file content of a sample as bytes.
+        '''
+        return self.label_text[self.label_ptr[idx]:self.label_ptr[idx + 1]].tobytes()
+
+    def image(self, idx):
+        '''
+        Get a sample's image as an (H, W, 3) RGB uint8 array.
+        '''
+        return self.decode(self.raw(idx), idx)
+
+    def decode(self, data, idx):
+        '''
+        Decode the stored bytes of sample idx.
+        '''
+        import cv2
+
+        if not self.exts[idx]:
+            shape = tuple(self.shapes[idx])
+            return np.frombuffer(data, dtype=np.uint8).reshape(shape[:2] if shape[2] == 1 else shape)
+        return cv2.cvtColor(cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR), cv2.COLOR_BGR2RGB)
+
+    def stream(self, shuffle_buffer=0, seed=0, decode=True, rank=0, world_size=1):
+        '''
+        Iterate (name, image, boxes) samples, reading each shard sequentially.
+
+        Shards are split round-robin over world_size readers (e.g. data
+        loader workers), this reader takes those of rank. With a
+        shuffle_buffer the shard order is shuffled and samples are drawn at
+        random from a buffer of that many, so the order changes with seed
+        while reads stay sequential. With decode=False images are the stored bytes.
+        '''
+        rng = np.random.default_rng(seed)
+        shards = np.arange(len(self.shards))[rank::world_size]
+        if shuffle_buffer:
+            shards = rng.permutation(shards)
+
+        buffer = []
+        for sample in self._read_shards(shards, decode):
+            if shuffle_buffer <= 1:
+                yield sample
+                continue
+            buffer.append(sample)
+            if len(buffer) >= shuffle_buffer:
+                pick = int(rng.integers(len(buffer)))
+                buffer[pick], buffer[-1] = buffer[-1], buffer[pick]
+                yield buffer.pop()
+        while buffer:
+            pick = int(rng.integers(len(buffer)))
+            buffer[pick], buffer[-1] = buffer[-1], buffer[pick]
+            yield buffer.pop()
+
+    def _read_shards(self, shards, decode):
+        order = np.argsort(self.shard, kind='stable')
+        bounds = np.searchsorted(self.shard[order], np.arange(len(self.shards) + 1))
+        for shard in shards.tolist():
+            with open(os.path.join(self.shard_dir, str(self.shards[shard])), 'rb') as shard_file:
+                # Samples are stored back to back in offset order
+                for idx in order[bounds[shard]:bounds[shard + 1]].tolist():
+                    data = shard_file.read(int(self.nbytes[idx]))
+                    image = self.decode(data, idx) if decode else data
+                    yield str(self.names[idx]), image, self.labels(idx)
+
+def pack_shards(source, out_dir, shard_bytes=256 * 2**20, encoding=None, workers=8):
+    '''
+    Pack a YOLO dataset into shards with ShardWriter.
+
+    source is a directory, where every image is packed with the label file
+    of the same stem (named by its path relative to source, without
+    extension), or a manifest DataFrame (or list of them) with 'img_path'
+    and 'ann_path' columns as used by stage_split (named by the image path
+    relative to the images' common directory, without extension). Images
+    without a label file are packed without labels. Raises ValueError if
+    two samples get the same name. Files are read and encoded on a thread
+    pool and written in order. Returns the number of samples and shards.
+    '''
+    if isinstance(source, str):
+        image_ext = DatasetCatalog.kinds['image']
+        pairs = []
+        for dir_path, dir_names, file_names in os.walk(source):
+            dir_names.sort()
+            for file_name in sorted(file_names):
+                stem, ext = os.path.splitext(file_name)
+                if ext.lower() in image_ext:
+                    label_path = os.path.join(dir_path, stem + '.txt')
+                    name = os.path.relpath(os.path.join(dir_path, stem), source).replace('\\', '/')
+                    pairs.append((name, os.path.join(dir_path, file_name), label_path if os.path.exists(label_path) else None))
+    else:
+        dfs = source if isinstance(source, (list, tuple)) else [source]
+        images = [p.replace('\\', '/') for df in dfs for p in df['img_path'].tolist()]
+        labels = [p.replace('\\', '/') for df in dfs for p in df['ann_path'].tolist()]
+        root = os.path.commonpath([os.path.dirname(os.path.abspath(p)) for p in images]) if images else ''
+        pairs = [(os.path.splitext(os.path.relpath(os.path.abspath(image), root))[0].replace('\\', '/'), image,
+                  label if os.path.exists(label) else None)
+                 for image, label in zip(images, labels)]
+
+    seen, duplicates = set(), set()
+    for name, _, _ in pairs:
+        (duplicates if name in seen else seen).add(name)
+    if duplicates:
+        duplicates = sorted(duplicates)
+        raise ValueError(f"Duplicate sample names: {duplicates[:5]}")
+
+    writer = ShardWriter(out_dir, shard_bytes=shard_bytes, encoding=encoding)
+
+    def load(pair):
+        name, image_path, label_path = pair
+        label_text = None
+        if label_path:
+            with open(label_path, 'rb') as label_file:
+                label_text = label_file.read()
+        return (name, *writer.encode(image_path), None, label_text)
+
+    # Map in chunks so at most a chunk of encoded images is held in memory
+    with writer, ThreadPoolExecutor(max_workers=workers) as executor:
+        for start in range(0, len(pairs), 1024):
+            for sample in executor.map(load, pairs[start:start + 1024]):
+                writer.append(*sample)
+    return {'samples': len(writer), 'shards': len(writer.shards)}
+
+def unpack_shards(shard_dir, output_folder, workers=8):
+    '''
+    Export shards back to the YOLO directory layout: <name><ext> images
+    (raw samples as PNG) and <name>.txt labels under output_folder. Labels
+    are written with the text stored at packing time, unchanged, and only
+    for samples that had a label file.
+    Returns the number of samples written.
+    '''
+    import cv2
+
+    reader = ShardReader(shard_dir)
+
+    def export(idx):
+        base = os.path.join(output_folder, str(reader.names[idx]))
+        os.makedirs(os.path.dirname(base), exist_ok=True)
+        ext = str(reader.exts[idx])
+        if ext:
+            with open(base + ext, 'wb') as image_file:
+                image_file.write(reader.raw(idx).tobytes())
+        else:
+            image = reader.image(idx)
+            cv2.imwrite(base + '.png', cv2.cvtColor(image, cv2.COLOR_RGB2BGR) if image.ndim == 3 else image)
+        if reader.has_label[idx]:
+            with open(base + '.txt', 'wb') as label_file:
+                label_file.write(reader.label_file(idx))
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(export, range(len(reader))))
+    return len(reader)
@@ -0,0 +1,168 @@
+import numpy as np
+
+# Bounding box geometry on (N, 5) arrays of (class, a, b, c, d) rows.
+# Formats for the four coordinate columns:
+#   'yolo': x_center, y_center, width, height
+#   'xyxy': x1, y1, x2, y2
+#   'xywh': x1, y1, width, height (top-left corner)
+# Coordinates are normalized to [0, 1] or in pixels, x is always in columns
+# 1 and 3 and y in columns 2 and 4, so scaling works for every format.
+
+FORMATS = ('yolo', 'xyxy', 'xywh')
+
+def as_boxes(boxes, dtype=None):
+    '''
+    Get boxes as a float (N, 5) array, accepting lists of rows or string tokens.
+    '''
+    arr = np.asarray(boxes)
+    if arr.dtype.kind not in 'f':
+        arr = arr.astype(dtype or np.float64)
+    elif dtype is not None:
+        arr = arr.astype(dtype, copy=False)
+    return arr.reshape(-1, 5)
+
+def read(file_path, dtype=np.float32):
+    '''
+    Read a YOLO label file straight into an (N, 5) array.
+
+    Only lines with exactly 5 values are kept, as in read_bbox_file.
+    '''
+    with open(file_path, 'r') as file:
+        return parse(file, dtype=dtype)
+
+def parse(lines, dtype=np.float32):
+    '''
+    Parse YOLO label text (a string or an iterable of lines) into an (N, 5) array.
+    '''
+    if isinstance(lines, str):
+        lines = lines.splitlines()
+    rows = [parts for parts in (line.split() for line in lines) if len(parts) == 5]
+    return np.array(rows, dtype=dtype).reshape(-1, 5)
+
+def write(file_path, boxes, precision=6):
+    '''
+    Write (N, 5) boxes to a YOLO label file, replacing it.
+    '''
+    boxes = as_boxes(boxes, dtype=np.float64)
+    with open(file_path, 'w') as file:
+        file.write("".join(
+            f"{int(c)} {a:.{precision}f} {b:.{precision}f} {w:.{precision}f} {h:.{precision}f}\n"
+            for c, a, b, w, h in boxes.tolist()
+        ))
+
+def convert(boxes, src='yolo', dst='xyxy'):
+    '''
+    Convert (N, 5) boxes between the 'yolo', 'xyxy' and 'xywh' formats.
+    '''
+    if src not in FORMATS or dst not in FORMATS:
+        raise ValueError(f"Unsupported box format: {src} -> {dst}")
+    boxes = as_boxes(boxes)
+    if src == dst:
+        return boxes.copy()
+
+    out = np.empty_like(boxes)
+    out[:, 0] = boxes[:, 0]
+    if src == 'yolo':
+        x1 = boxes[:, 1] - boxes[:, 3] / 2
+        y1 = boxes[:, 2] - boxes[:, 4] / 2
+        if dst == 'xyxy':
+            out[:, 1], out[:, 2] = x1, y1
+            out[:, 3] = boxes[:, 1] + boxes[:, 3] / 2
+            out[:, 4] = boxes[:, 2] + boxes[:, 4] / 2
+        else:
+            out[:, 1], out[:, 2] = x1, y1
+            out[:, 3:] = boxes[:, 3:]
+    elif src == 'xyxy':
+        if dst == 'yolo':
+            out[:, 1] = (boxes[:, 1] + boxes[:, 3]) / 2
+            out[:, 2] = (boxes[:, 2] + boxes[:, 4]) / 2
+        else:
+            out[:, 1:3] = boxes[:, 1:3]
+        out[:, 3] = boxes[:, 3] - boxes[:, 1]
+        out[:, 4] = boxes[:, 4] - boxes[:, 2]
+    else:
+        if dst == 'yolo':
+            out[:, 1] = boxes[:, 1] + boxes[:, 3] / 2
+            out[:, 2] = boxes[:, 2] + boxes[:, 4] / 2
+            out[:, 3:] = boxes[:, 3:]
+        else:
+            out[:, 1:3] = boxes[:, 1:3]
+            out[:, 3] = boxes[:, 1] + boxes[:, 3]
+            out[:, 4] = boxes[:, 2] + boxes[:, 4]
+    return out
+
+def to_pixels(boxes, width, height):
+    '''
+    Scale normalized boxes (any format) to pixel coordinates.
+    '''
+    out = as_boxes(boxes).copy()
+    out[:, 1:] *= np.array([width, height, width, height], dtype=out.dtype)
+    return out
+
+def to_normalized(boxes, width, height):
+    '''
+    Scale pixel boxes (any format) to normalized coordinates.
+    '''
+    out = as_boxes(boxes).copy()
+    out[:, 1:] /= np.array([width, height, width, height], dtype=out.dtype)
+    return out
+
+def area(boxes, fmt='yolo'):
+    '''
+    Get the area of each box.
+    '''
+    boxes = as_boxes(boxes)
+    if fmt == 'xyxy':
+        return (boxes[:, 3] - boxes[:, 1]) * (boxes[:, 4] - boxes[:, 2])
+    return boxes[:, 3] * boxes[:, 4]
+
+def clip(boxes, fmt='yolo', lower=0.0, upper=1.0):
+    '''
+    Clip boxes to the [lower, upper] window, e.g. the image for normalized boxes.
+    '''
+    xyxy = convert(boxes, fmt, 'xyxy')
+    np.clip(xyxy[:, 1:], lower, upper, out=xyxy[:, 1:])
+    return convert(xyxy, 'xyxy', fmt)
+
+def filter_area(boxes, min_area=0.0, max_area=np.inf, fmt='yolo'):
+    '''
+    Keep the boxes whose area lies in [min_area, max_area].
+    '''
+    boxes = as_boxes(boxes)
+    box_area = area(boxes, fmt)
+    return boxes[(box_area >= min_area) & (box_area <= max_area)]
+
+def iou(boxes_a, boxes_b, fmt='yolo'):
+    '''
+    Get the (N, M) matrix of pairwise intersection over union.
+    '''
+    a = convert(boxes_a, fmt, 'xyxy')
+    b = convert(boxes_b, fmt, 'xyxy')
+
+    ix1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    iy1 = np.maximum(a[:, None, 2], b[None, :, 2])
+    ix2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    iy2 = np.minimum(a[:, None, 4], b[None, :, 4])
+    inter = np.clip(ix2 - ix1, 0, None) * np.clip(iy2 - iy1, 0, None)
+
+    union = area(a, 'xyxy')[:, None] + area(b, 'xyxy')[None, :] - inter
+    return np.divide(inter, union, out=np.zeros_like(inter), where=union > 0)
+
+def map_classes(boxes, mapping, default=None):
+    '''
+    Remap the class column through a dict (or array indexed by class).
+
+    Classes missing from a dict keep their value, or take default if given.
+    '''
+    out = as_boxes(boxes).copy()
+    classes = out[:, 0].astype(np.int64)
+    if isinstance(mapping, dict):
+        lookup = np.arange(max([*mapping.keys(), classes.max(initial=0)]) + 1)
+        if default is not None:
+            lookup[:] = default
+        for src, dst in mapping.items():
+            lookup[src] = dst
+        out[:, 0] = lookup[classes]
+    else:
+        out[:, 0] = np.asarray(mapping)[classes]
+    return out
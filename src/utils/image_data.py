@@ -1,7 +1,13 @@
 import os
+import json
+from concurrent.futures import ProcessPoolExecutor
+
 import cv2
+import numpy as np
 from PIL import Image
 
+from . import label_data
+
 def is_blank_image(image_path, threshold=10):
     '''
     Check if an image is blank (all pixels below a certain threshold).
@@ -11,6 +17,67 @@ def is_blank_image(image_path, threshold=10):
         return False
     return (img < threshold).all()
 
+def is_blank_array(img, threshold=10, step=16):
+    '''
+    Check if a decoded image array is blank, as is_blank_image does.
+    '''
+    if img is None:
+        return False
+    # Most frames are not blank, a sparse pixel grid rejects them before the full pass
+    if (img[::step, ::step] >= threshold).any():
+        return False
+    return bool((img < threshold).all())
+
+def is_blank_file(image_path, threshold=10):
+    '''
+    Check if an image file is blank, decoding JPEGs at 1/8 scale first to reject bright frames.
+    '''
+    if os.path.splitext(image_path)[1].lower() in ('.jpg', '.jpeg'):
+        # A reduced JPEG pixel is a block average, so a bright one means a bright block
+        reduced = cv2.imread(image_path, cv2.IMREAD_REDUCED_COLOR_8)
+        if reduced is not None and (reduced >= threshold).any():
+            return False
+    return is_blank_array(cv2.imread(image_path), threshold)
+
+def scan_blank_images(image_paths, threshold=10, index_file=None, workers=None, min_parallel=2000):
+    '''
+    Check many images for blank frames across a process pool.
+
+    Results are kept in index_file (JSON of path to size, mtime, threshold
+    and result) when given, so a rescan only decodes new or modified
+    files. Returns the list of blank image paths.
+    '''
+    index = {}
+    if index_file is not None and os.path.exists(index_file):
+        with open(index_file, 'r') as f:
+            index = json.load(f)
+
+    keys = {}
+    for path in image_paths:
+        stat = os.stat(path)
+        keys[path] = [stat.st_size, stat.st_mtime_ns, threshold]
+    todo = [path for path, key in keys.items() if index.get(path, [None])[:3] != key]
+
+    if len(todo) >= min_parallel:
+        chunks = [todo[i:i + 500] for i in range(0, len(todo), 500)]
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = [blank for chunk in executor.map(_scan_blank_chunk, chunks, [threshold] * len(chunks)) for blank in chunk]
+    else:
+        results = _scan_blank_chunk(todo, threshold)
+    for path, blank in zip(todo, results):
+        index[path] = keys[path] + [blank]
+
+    if index_file is not None:
+        tmp_file = f"{index_file}.{os.getpid()}.tmp"
+        with open(tmp_file, 'w') as f:
+            json.dump(index, f)
+        os.replace(tmp_file, index_file)
+
+    return [path for path in image_paths if index[path][3]]
+
+def _scan_blank_chunk(paths, threshold):
+    return [is_blank_file(path, threshold) for path in paths]
+
 def scale_image_down(image_path, max_size):
     '''
     Scale an image down to a maximum size.
@@ -38,6 +105,111 @@ def image_quadrants(image_path):
     }
     return quadrants
 
+def tile_grid(width, height, rows=2, cols=2, overlap=0.1):
+    '''
+    Get the pixel extents of a rows x cols grid of overlapping tiles.
+
+    overlap is the fraction of the image width (height) shared by
+    neighbouring tiles, so each tile spans (1 + (n - 1) * overlap) / n of the
+    image. The defaults give the 2x2, 55%/45% layout of image_quadrants.
+    Returns a (rows * cols, 4) int array of (x1, y1, x2, y2), row-major.
+    '''
+    patch_w = int(width * (1 + (cols - 1) * overlap) / cols)
+    patch_h = int(height * (1 + (rows - 1) * overlap) / rows)
+    # Spread the tiles so the first starts at 0 and the last ends at the edge
+    xs = [round(c * (width - patch_w) / (cols - 1)) if cols > 1 else 0 for c in range(cols)]
+    ys = [round(r * (height - patch_h) / (rows - 1)) if rows > 1 else 0 for r in range(rows)]
+    return np.array([(x, y, x + patch_w, y + patch_h) for y in ys for x in xs], dtype=np.int64)
+
+def tile_image(image_path, output_folder, label_path=None, rows=2, cols=2, overlap=0.1, min_visible=None,
+               min_size=800, ext='.png'):
+    '''
+    Split an image and its YOLO labels into overlapping tiles.
+
+    The image is decoded once and tiled with tile_array. Tiles are named
+    <base>_<row><col>, which matches the quadrant aliases for a 2x2 grid.
+    min_visible is passed to tile_array, the default keeps the boxes
+    bbox_quadrants keeps. Images whose width and height are both below
+    min_size are skipped.
+    Returns the number of tiles written.
+    '''
+    img = cv2.imread(image_path)
+    if img is None:
+        print(f"Failed to read image {image_path}")
+        return 0
+    height, width = img.shape[:2]
+    if height < min_size and width < min_size:
+        return 0
+
+    boxes = label_data.read_bbox_array(label_path) if label_path is not None else None
+    base_name = os.path.splitext(os.path.basename(image_path))[0]
+    tile_array(img, output_folder, base_name, boxes=boxes, rows=rows, cols=cols, overlap=overlap,
+               min_visible=min_visible, min_size=min_size, ext=ext)
+    return rows * cols
+
+def tile_array(img, output_folder, base_name, boxes=None, rows=2, cols=2, overlap=0.1, min_visible=None,
+               min_size=800, ext='.png', rgb=False):
+    '''
+    Write the overlapping tiles of an in-memory image and, if given, its YOLO boxes.
+
+    img is a (H, W, 3) BGR array (RGB if rgb is True) and every tile is
+    written from an array view. boxes is a (N, 5) array remapped with
+    label_data.tile_boxes, one label file is written per tile. A box is
+    kept in a tile when more than min_visible of its area is inside it. The
+    default (None) is the cut-off of bbox_quadrants, which compares 10% to
+    the visible area measured in tile units, i.e. min_visible is
+    0.1 * (tile area / image area), about 0.03 for the 2x2 layout. Files are
+    named <base>_<row><col> and replaced atomically, in row-major order.
+    As in tile_image, images whose width and height are both below
+    min_size are not tiled. Returns the number of bytes written (images
+    and labels), 0 for a skipped image.
+    '''
+    height, width = img.shape[:2]
+    if height < min_size and width < min_size:
+        return 0
+    tiles = tile_grid(width, height, rows=rows, cols=cols, overlap=overlap)
+    tiled_boxes = None
+    if boxes is not None:
+        norm_tiles = tiles / np.array([width, height, width, height], dtype=np.float64)
+        if min_visible is None:
+            min_visible = 0.1 * (norm_tiles[:, 2] - norm_tiles[:, 0]) * (norm_tiles[:, 3] - norm_tiles[:, 1])
+        tiled_boxes = label_data.tile_boxes(boxes, norm_tiles, min_visible=min_visible)
+    if rgb:
+        img = img[:, :, ::-1]
+
+    os.makedirs(output_folder, exist_ok=True)
+    nbytes = 0
+    for idx, (x1, y1, x2, y2) in enumerate(tiles.tolist()):
+        tile_path = os.path.join(output_folder, f"{base_name}_{idx // cols}{idx % cols}")
+        if tiled_boxes is not None:
+            label_data.write_bbox_array(tile_path + '.txt', tiled_boxes[idx])
+            nbytes += os.path.getsize(tile_path + '.txt')
+        # Keep the image extension on the temporary name so cv2 picks the encoder
+        tmp_path = f"{tile_path}.{os.getpid()}.tmp{ext}"
+        cv2.imwrite(tmp_path, img[y1:y2, x1:x2])
+        nbytes += os.path.getsize(tmp_path)
+        os.replace(tmp_path, tile_path + ext)
+    return nbytes
+
+def tile_directory(input_folder, output_folder, workers=None, **kwargs):
+    '''
+    Tile every image in a directory, with its same-named label file, across a process pool.
+
+    Extra keyword arguments are passed to tile_image. Returns the total
+    number of tiles written.
+    '''
+    file_ext = ('.png', '.jpg', '.jpeg', '.gif', '.bmp')
+    tasks = []
+    for file_name in sorted(os.listdir(input_folder)):
+        stem, extension = os.path.splitext(file_name)
+        if extension.lower() in file_ext:
+            label_path = os.path.join(input_folder, stem + '.txt')
+            tasks.append((os.path.join(input_folder, file_name), label_path if os.path.exists(label_path) else None))
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(tile_image, image_path, output_folder, label_path, **kwargs) for image_path, label_path in tasks]
+        return sum(future.result() for future in futures)
+
 def draw_bbox(image_path, bboxes):
     '''
     Draw bounding boxes on an image.
@@ -1,64 +1,130 @@
-from cProfile import label
 import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from . import files
+from . import geometry
 
 # Change video annotations to YOLO COCO text format
 def convert_annotations(file_name, input_path, output_folder, width, height):
         
-    frame_count = 0
-
     text_file_name = os.path.splitext(file_name)[0]
     input_file = os.path.join(input_path, f"{text_file_name}.txt")
     
     # Ensure the output folder exists
     os.makedirs(output_folder, exist_ok=True)
 
-    # Create/open the input annotation file
+    # Parse the whole file, then normalize all boxes at once
+    frames, box_frames, boxes, classes = parse_annotation_file(input_file)
+    yolo_boxes = normalize_boxes(boxes, width, height)
+
+    # Group the boxes by frame, boxes are stored in file order
+    splits = np.searchsorted(box_frames, np.arange(len(frames)), side='left')
+    ends = np.append(splits[1:], len(box_frames))
+
+    for idx, frame in enumerate(frames):
+        lines = [
+            f"{class_id} {x_center} {y_center} {bbox_width} {bbox_height}\n"
+            for class_id, (x_center, y_center, bbox_width, bbox_height)
+            in zip(classes[splits[idx]:ends[idx]].tolist(), yolo_boxes[splits[idx]:ends[idx]].tolist())
+        ]
+        # Truncate rather than append, so reruns never duplicate boxes
+        output_file = os.path.join(output_folder, f"{text_file_name}_frame_{frame:04d}.txt")
+        write_atomic(output_file, "".join(lines))
+    
+    print(f"Wrote {len(frames)} annotation files to {output_folder}")
+    return len(frames)
+
+def parse_annotation_file(input_file):
+    '''
+    Parse a Drone-vs-Bird annotation file into arrays.
+
+    Each line is: frame num_objects followed by num_objects groups of
+    Position_X Position_Y Width Height Class_ID. Returns the frame numbers
+    per line, the line index of each box, an (N, 4) float64 array of
+    x, y, width, height in pixels and the class of each box (0 for drone,
+    1 otherwise).
+    '''
+    frames = []
+    box_frames = []
+    tokens = []
     with open(input_file, 'r') as infile:
-        # Each line in the input file corresponds to a single frame
-        for line in infile:
+        for idx, line in enumerate(infile):
             parts = line.split()
-            
-            frame = int(parts.pop(0))  # Remove the frame number from the parts
-            num_objects = int(parts.pop(0)) # Remove the number of objects from the parts
-            
-            # Remaining parts will be in the format: Position_X Position_Y Width Height Class_ID
-            # Each object begins at an index multiple of 5
-            
-            # Create the output file
-            output_file = os.path.join(output_folder, f"{text_file_name}_frame_{frame:04d}.txt")
-            
-            with open(output_file, 'a') as outfile:
-                # Loop for each object in the line
-                for i in range(num_objects):
-                    
-                    object_details = parts[i * 5:i * 5 + 5]
-                    x_pos = float(object_details[0])
-                    y_pos = float(object_details[1])
-                    bbox_width = float(object_details[2])
-                    bbox_height = float(object_details[3])
-                    class_id = object_details[4]
-
-                    # Convert class_id to integer (all labels should be drone)
-                    class_id = 0 if class_id == 'drone' else 1
-                    
-                    # Convert position coordinates to bounding box center
-                    x_center = x_pos + bbox_width / 2
-                    y_center = y_pos + bbox_height / 2
-                    
-                    # Normalize the coordinates to the range [0, 1]
-                    x_center /= width
-                    y_center /= height
-                    bbox_width /= width
-                    bbox_height /= height
-                        
-                    # Write the YOLO format to the output file
-                    outfile.write(f"{class_id} {x_center} {y_center} {bbox_width} {bbox_height}\n")
-            
-            frame_count += 1
-    
-    print(f"Wrote {frame_count} annotation files to {output_folder}")
+            if not parts:
+                continue
+            num_objects = int(parts[1])
+            frames.append(int(parts[0]))
+            box_frames.extend([len(frames) - 1] * num_objects)
+            tokens.extend(parts[2:2 + num_objects * 5])
+
+    objects = np.array(tokens, dtype=object).reshape(-1, 5)
+    boxes = objects[:, :4].astype(np.float64)
+    classes = np.where(objects[:, 4] == 'drone', 0, 1)
+    return np.array(frames, dtype=np.int64), np.array(box_frames, dtype=np.int64), boxes, classes
+
+def normalize_boxes(boxes, width, height):
+    '''
+    Convert (N, 4) top-left x, y, width, height pixel boxes to normalized YOLO centers.
+    '''
+    yolo_boxes = np.empty_like(boxes, dtype=np.float64)
+    # Same operation order as the per-box conversion, so the values match exactly
+    yolo_boxes[:, 0] = (boxes[:, 0] + boxes[:, 2] / 2) / width
+    yolo_boxes[:, 1] = (boxes[:, 1] + boxes[:, 3] / 2) / height
+    yolo_boxes[:, 2] = boxes[:, 2] / width
+    yolo_boxes[:, 3] = boxes[:, 3] / height
+    return yolo_boxes
+
+def write_atomic(file_path, text):
+    '''
+    Write a text file through a temporary file so readers never see a partial write.
+    '''
+    tmp_path = f"{file_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as outfile:
+        outfile.write(text)
+    os.replace(tmp_path, file_path)
+
+def convert_directory(input_path, output_folder, workers=None, probe_cache=None):
+    '''
+    Convert the annotations of every video in a directory across a process pool.
+
+    Resolutions come from video_data.probe_resolution in this process, so
+    with a probe_cache file each video is opened at most once across runs.
+    Reruns rewrite the same files and are idempotent. Returns a dict of
+    frame counts per video.
+    '''
+    # Deferred so label workers do not import cv2
+    from . import video_data
+
+    video_files = sorted(files.get_video_files(input_path))
+    resolutions = {
+        video_file: video_data.probe_resolution(video_file, input_path, cache_file=probe_cache)
+        for video_file in video_files
+    }
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            video_file: executor.submit(convert_annotations, video_file, input_path, output_folder, *resolutions[video_file])
+            for video_file in video_files
+        }
+        return {video_file: future.result() for video_file, future in futures.items()}
     
     
+def annotated_frames(file_name, input_path):
+    '''
+    Get the frame numbers that contain at least one object in a video's annotation file.
+    '''
+    text_file_name = os.path.splitext(file_name)[0]
+    input_file = os.path.join(input_path, f"{text_file_name}.txt")
+
+    frames = []
+    with open(input_file, 'r') as infile:
+        for line in infile:
+            parts = line.split()
+            if len(parts) > 1 and parts[1] != '0':
+                frames.append(int(parts[0]))
+    return frames
+
 def frame_overview(directory):
     
     frames = []
@@ -85,6 +151,7 @@ def bbox_area(bbox):
     '''
     Calculate the area of a bounding box.
     '''
+    # Plain float arithmetic, building an array per box would be slower (see geometry.area for arrays)
     _, x_center, y_center, width, height = map(float, bbox)
     return width * height
 
@@ -111,7 +178,7 @@ def bbox_info(bbox):
         "y_center": y_center,
         "width": width,
         "height": height,
-        "area": bbox_area(bbox)
+        "area": width * height
     }
 
 def bbox_xxyy(bbox):
@@ -126,7 +193,7 @@ def bbox_xxyy(bbox):
     y2 = y_center + height / 2
     return (x1, y1, x2, y2)
 
-def bbox_yolo(bbox):
+def bbox_yolo(bbox, class_id=0):
     '''
     Convert a bounding box from (x1, y1, x2, y2) to YOLO format (x_center, y_center, width, height).
     '''
@@ -135,8 +202,67 @@ def bbox_yolo(bbox):
     y_center = (y1 + y2) / 2
     width = x2 - x1
     height = y2 - y1
-    # Note that class is hard-coded to 0 (drone)
-    return (0, x_center, y_center, width, height)
+    # Class defaults to 0 (drone)
+    return (class_id, x_center, y_center, width, height)
+
+def read_bbox_array(file_path):
+    '''
+    Read bounding boxes from a text file into a float32 (N, 5) array.
+    '''
+    return geometry.read(file_path)
+
+def write_bbox_array(file_path, boxes):
+    '''
+    Write a (N, 5) array of YOLO boxes to a text file, replacing it.
+    '''
+    lines = [
+        f"{int(class_id)} {x_center:.6f} {y_center:.6f} {width:.6f} {height:.6f}\n"
+        for class_id, x_center, y_center, width, height in np.asarray(boxes, dtype=np.float64).tolist()
+    ]
+    write_atomic(file_path, "".join(lines))
+
+def tile_boxes(boxes, tiles, min_visible=0.1):
+    '''
+    Assign YOLO boxes to tiles and remap them into each tile's coordinates.
+
+    boxes is a (N, 5) array of (class, x_center, y_center, width, height)
+    and tiles a (T, 4) array of normalized (x1, y1, x2, y2) tile extents.
+    Every box is intersected with every tile at once. A box is kept in a
+    tile when more than min_visible of its area is inside it (a scalar or
+    one value per tile), clipped to the tile. Returns a list of T arrays of
+    (M, 5) YOLO boxes normalized to the tile.
+    '''
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 5)
+    tiles = np.asarray(tiles, dtype=np.float64).reshape(-1, 4)
+
+    # Box corners as (N, 1) columns against (1, T) tile rows
+    half_w, half_h = boxes[:, 3] / 2, boxes[:, 4] / 2
+    x1 = (boxes[:, 1] - half_w)[:, None]
+    y1 = (boxes[:, 2] - half_h)[:, None]
+    x2 = (boxes[:, 1] + half_w)[:, None]
+    y2 = (boxes[:, 2] + half_h)[:, None]
+    tx1, ty1, tx2, ty2 = (tiles[:, i][None, :] for i in range(4))
+
+    # Intersection of every box with every tile, shape (N, T)
+    ix1, iy1 = np.maximum(x1, tx1), np.maximum(y1, ty1)
+    ix2, iy2 = np.minimum(x2, tx2), np.minimum(y2, ty2)
+    inter = np.clip(ix2 - ix1, 0, None) * np.clip(iy2 - iy1, 0, None)
+    area = (boxes[:, 3] * boxes[:, 4])[:, None]
+    visible = np.divide(inter, area, out=np.zeros_like(inter), where=area > 0)
+    keep = visible > min_visible
+
+    tile_w, tile_h = tx2 - tx1, ty2 - ty1
+    tiled = []
+    for t in range(len(tiles)):
+        rows = keep[:, t]
+        out = np.empty((rows.sum(), 5), dtype=np.float64)
+        out[:, 0] = boxes[rows, 0]
+        out[:, 1] = ((ix1[rows, t] + ix2[rows, t]) / 2 - tx1[0, t]) / tile_w[0, t]
+        out[:, 2] = ((iy1[rows, t] + iy2[rows, t]) / 2 - ty1[0, t]) / tile_h[0, t]
+        out[:, 3] = (ix2[rows, t] - ix1[rows, t]) / tile_w[0, t]
+        out[:, 4] = (iy2[rows, t] - iy1[rows, t]) / tile_h[0, t]
+        tiled.append(out)
+    return tiled
 
 def bbox_quadrants(bboxes):
     '''
@@ -200,4 +326,184 @@ def bbox_quadrants(bboxes):
         if all(0 <= n <= 1 for n in bottom_right) and bottom_right_area_ratio > 0.1:
             quadrants["bottom_right"].append(bottom_right)
 
-    return quadrants
\ No newline at end of file
+    return quadrants
+
+
+class LabelIndex:
+    '''
+    Columnar index of every YOLO label file under a directory.
+
+    The directory is scanned once (recursively, files parsed in parallel)
+    into two tables held as numpy arrays:
+    - files: one entry per label file with its path relative to root, mtime,
+      split (first sub-directory, e.g. train/val/test), video id, frame number
+      and the range of its boxes in the box table
+    - boxes: a structured array with file, video, frame, split, class,
+      x, y, w, h and area columns
+    Video ids and frame numbers come from "<video>_frame_<n>.txt" names, other
+    names use the file stem as the video id and frame -1. The index can be
+    saved to an .npz file and update only re-parses new or modified files.
+    '''
+    box_dtype = np.dtype([
+        ('file', np.int32), ('video', np.int32), ('frame', np.int32), ('split', np.int16),
+        ('class', np.int16), ('x', np.float32), ('y', np.float32), ('w', np.float32),
+        ('h', np.float32), ('area', np.float32),
+    ])
+
+    def __init__(self, root, index_file=None):
+        self.root = root
+        self.index_file = index_file
+        self.names = np.array([], dtype=str)
+        self.mtimes = np.array([], dtype=np.int64)
+        self.counts = np.array([], dtype=np.int64)
+        self.raw = np.empty((0, 5), dtype=np.float32)
+        self.videos = []
+        self.splits = []
+        self.boxes = np.empty(0, dtype=self.box_dtype)
+
+        if index_file is not None and os.path.exists(index_file):
+            with np.load(index_file) as index:
+                self.names = index['names']
+                self.mtimes = index['mtimes']
+                self.counts = index['counts']
+                self.raw = index['raw']
+            self._build_columns()
+
+    def update(self, workers=None, min_parallel=2000):
+        '''
+        Rescan the directory, parsing only new or modified label files.
+        '''
+        scanned = {}
+        for dir_path, _, file_names in os.walk(self.root):
+            for file_name in file_names:
+                if file_name.endswith('.txt'):
+                    path = os.path.join(dir_path, file_name)
+                    scanned[os.path.relpath(path, self.root)] = os.stat(path).st_mtime_ns
+
+        # Reuse rows of files whose mtime has not changed
+        known = {}
+        starts = np.concatenate([[0], np.cumsum(self.counts)])
+        for idx, (name, mtime) in enumerate(zip(self.names.tolist(), self.mtimes.tolist())):
+            if scanned.get(name) == mtime:
+                known[name] = self.raw[starts[idx]:starts[idx + 1]]
+
+        todo = [name for name in scanned if name not in known]
+        paths = [os.path.join(self.root, name) for name in todo]
+        if len(paths) >= min_parallel:
+            chunks = [paths[i:i + 500] for i in range(0, len(paths), 500)]
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                parsed = [arr for chunk in executor.map(_parse_label_files, chunks) for arr in chunk]
+        else:
+            parsed = _parse_label_files(paths)
+        known.update(zip(todo, parsed))
+
+        names = sorted(scanned)
+        self.names = np.array(names, dtype=str)
+        self.mtimes = np.array([scanned[name] for name in names], dtype=np.int64)
+        self.counts = np.array([len(known[name]) for name in names], dtype=np.int64)
+        self.raw = np.concatenate([known[name] for name in names]) if names else np.empty((0, 5), dtype=np.float32)
+        self._build_columns()
+
+        if self.index_file is not None:
+            self.save()
+        return self
+
+    def save(self, index_file=None):
+        '''
+        Save the index to an .npz file.
+        '''
+        index_file = index_file or self.index_file
+        tmp_file = f"{index_file}.{os.getpid()}.tmp.npz"
+        np.savez(tmp_file, names=self.names, mtimes=self.mtimes, counts=self.counts, raw=self.raw)
+        os.replace(tmp_file, index_file)
+
+    def counts_per_video(self):
+        '''
+        Get the number of boxes per video id.
+        '''
+        counts = np.bincount(self.boxes['video'], minlength=len(self.videos))
+        return dict(zip(self.videos, counts.tolist()))
+
+    def frames_per_video(self):
+        '''
+        Get the number of label files (frames) and empty frames per video id.
+        '''
+        frames = np.bincount(self.file_videos, minlength=len(self.videos))
+        empty = np.bincount(self.file_videos[self.counts == 0], minlength=len(self.videos))
+        return {video: (total, zero) for video, total, zero in zip(self.videos, frames.tolist(), empty.tolist())}
+
+    def empty_frames(self):
+        '''
+        Get the relative paths of label files without any boxes.
+        '''
+        return self.names[self.counts == 0].tolist()
+
+    def split_stats(self):
+        '''
+        Get file, box and empty-frame counts plus mean box size per split.
+        '''
+        stats = {}
+        for code, split in enumerate(self.splits):
+            boxes = self.boxes[self.boxes['split'] == code]
+            in_split = self.file_splits == code
+            stats[split] = {
+                'files': int(in_split.sum()),
+                'empty_files': int((self.counts[in_split] == 0).sum()),
+                'boxes': len(boxes),
+                'mean_width': float(boxes['w'].mean()) if len(boxes) else 0.0,
+                'mean_height': float(boxes['h'].mean()) if len(boxes) else 0.0,
+                'mean_area': float(boxes['area'].mean()) if len(boxes) else 0.0,
+            }
+        return stats
+
+    def to_dataframe(self):
+        '''
+        Get the box table as a pandas DataFrame with video and split names.
+        '''
+        import pandas as pd
+        df = pd.DataFrame(self.boxes)
+        df['video'] = pd.Categorical.from_codes(df['video'], self.videos)
+        df['split'] = pd.Categorical.from_codes(df['split'], self.splits)
+        df['file'] = self.names[self.boxes['file']]
+        return df
+
+    def _build_columns(self):
+        # Derive split, video and frame per file, then broadcast them to the boxes
+        splits, videos, frames = [], [], []
+        for name in self.names.tolist():
+            parts = name.replace('\\', '/').split('/')
+            splits.append(parts[0] if len(parts) > 1 else '')
+            stem = os.path.splitext(parts[-1])[0]
+            video, sep, frame = stem.rpartition('_frame_')
+            if sep and frame.isdigit():
+                videos.append(video)
+                frames.append(int(frame))
+            else:
+                videos.append(stem)
+                frames.append(-1)
+
+        self.splits, self.file_splits = _codes(splits)
+        self.videos, self.file_videos = _codes(videos)
+        self.file_frames = np.array(frames, dtype=np.int32)
+
+        file_idx = np.repeat(np.arange(len(self.names), dtype=np.int32), self.counts)
+        boxes = np.empty(len(self.raw), dtype=self.box_dtype)
+        boxes['file'] = file_idx
+        boxes['video'] = self.file_videos[file_idx]
+        boxes['frame'] = self.file_frames[file_idx]
+        boxes['split'] = self.file_splits[file_idx]
+        boxes['class'] = self.raw[:, 0]
+        boxes['x'] = self.raw[:, 1]
+        boxes['y'] = self.raw[:, 2]
+        boxes['w'] = self.raw[:, 3]
+        boxes['h'] = self.raw[:, 4]
+        boxes['area'] = self.raw[:, 3] * self.raw[:, 4]
+        self.boxes = boxes
+
+def _codes(values):
+    uniques, codes = np.unique(np.array(values, dtype=str), return_inverse=True)
+    return uniques.tolist(), codes.astype(np.int32)
+
+def _parse_label_files(paths):
+    # Parse label files into (N, 5) float32 arrays
+    return [geometry.read(path) for path in paths]
@@ -1,14 +1,196 @@
-import vtk
-from vtk.util import numpy_support
-from PIL import Image
-from PIL import ImageFilter
 import numpy as np
-from google import genai
 import os
 import io
+import sys
+import json
+import time
+import random
+import asyncio
+import hashlib
+import functools
+import contextlib
+import importlib.util
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from . import files
+
+def _lazy_import(name):
+    # Import a module on first attribute access, vtk and google.genai alone take seconds
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    # Bind the submodule on its package, as a regular import does (PIL.Image)
+    parent, _, child = name.rpartition('.')
+    if parent:
+        setattr(sys.modules[parent], child, module)
+    return module
+
+vtk = _lazy_import('vtk')
+Image = _lazy_import('PIL.Image')
+ImageFilter = _lazy_import('PIL.ImageFilter')
+genai = _lazy_import('google.genai')
+
+
+class StageProfiler:
+    '''
+    Wall time, call counts, bytes written and a duration histogram per pipeline stage.
+
+    Durations go into log2 buckets of microseconds, so percentiles are
+    approximate but recording stays cheap. With trace=True every call is
+    also kept as a Chrome trace event. Snapshots from worker processes are
+    combined with merge, see generate_dataset.
+    '''
+    buckets = 40
+
+    def __init__(self, trace=False):
+        self.trace = trace
+        self.stats = {}
+        self.events = []
+
+    def record(self, name, start_ns, end_ns, nbytes=0):
+        stat = self.stats.get(name)
+        if stat is None:
+            stat = self.stats[name] = {"calls": 0, "ns": 0, "bytes": 0, "histogram": [0] * self.buckets}
+        duration = end_ns - start_ns
+        stat["calls"] += 1
+        stat["ns"] += duration
+        stat["bytes"] += nbytes
+        stat["histogram"][min((duration // 1000).bit_length(), self.buckets - 1)] += 1
+        if self.trace:
+            self.events.append((name, start_ns, duration, os.getpid()))
+
+    def drain(self):
+        '''
+        Get the stats and events recorded so far and reset them.
+        '''
+        snapshot = {"stats": self.stats, "events": self.events}
+        self.stats, self.events = {}, []
+        return snapshot
+
+    def merge(self, snapshot):
+        '''
+        Add a snapshot from drain, e.g. from a worker process.
+        '''
+        for name, other in snapshot["stats"].items():
+            stat = self.stats.setdefault(name, {"calls": 0, "ns": 0, "bytes": 0, "histogram": [0] * self.buckets})
+            stat["calls"] += other["calls"]
+            stat["ns"] += other["ns"]
+            stat["bytes"] += other["bytes"]
+            stat["histogram"] = [a + b for a, b in zip(stat["histogram"], other["histogram"])]
+        if self.trace:
+            self.events.extend(snapshot["events"])
+
+    def percentile(self, name, q):
+        '''
+        Get the upper bound in seconds of the histogram bucket holding the q-th percentile of a stage.
+        '''
+        histogram = self.stats[name]["histogram"]
+        cumulative = np.cumsum(histogram)
+        bucket = int(np.searchsorted(cumulative, q / 100 * cumulative[-1]))
+        return (2 ** bucket) / 1e6
+
+    def summary(self):
+        '''
+        Get a text report of every stage, slowest first. Nested stages overlap.
+        '''
+        lines = [f"{'stage':16s} {'calls':>8s} {'total s':>9s} {'mean ms':>9s} {'p50 ms':>8s} {'p95 ms':>8s} {'MB':>8s}"]
+        for name, stat in sorted(self.stats.items(), key=lambda item: -item[1]["ns"]):
+            lines.append(
+                f"{name:16s} {stat['calls']:8d} {stat['ns'] / 1e9:9.3f} {stat['ns'] / 1e6 / stat['calls']:9.3f} "
+                f"{self.percentile(name, 50) * 1e3:8.3f} {self.percentile(name, 95) * 1e3:8.3f} {stat['bytes'] / 2**20:8.2f}"
+            )
+        return "\n".join(lines)
+
+    def to_json(self, file_path):
+        '''
+        Save the per-stage stats to a JSON file.
+        '''
+        with open(file_path, "w") as json_file:
+            json.dump(self.stats, json_file, indent=2)
+
+    def to_chrome_trace(self, file_path):
+        '''
+        Save the recorded events as a Chrome trace (chrome://tracing, Perfetto), needs trace=True.
+        '''
+        events = [
+            {"name": name, "ph": "X", "ts": start_ns / 1000, "dur": duration / 1000, "pid": pid, "tid": pid}
+            for name, start_ns, duration, pid in self.events
+        ]
+        with open(file_path, "w") as trace_file:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, trace_file)
+
+_profiler = None
+
+def enable_profiling(trace=False):
+    '''
+    Start recording pipeline stages in this process and return the new StageProfiler.
+    '''
+    global _profiler
+    _profiler = StageProfiler(trace=trace)
+    return _profiler
+
+def disable_profiling():
+    '''
+    Stop recording pipeline stages and return the StageProfiler that was active, if any.
+    '''
+    global _profiler
+    profiler, _profiler = _profiler, None
+    return profiler
+
+class _StageBytes:
+    # Byte count of a stage, settable inside the block once the size is known
+    __slots__ = ("nbytes",)
+
+    def __init__(self, nbytes=0):
+        self.nbytes = nbytes
+
+@contextlib.contextmanager
+def _timed_stage(profiler, name, nbytes):
+    record = _StageBytes(nbytes)
+    start = time.perf_counter_ns()
+    try:
+        yield record
+    finally:
+        profiler.record(name, start, time.perf_counter_ns(), record.nbytes)
+
+_null_stage = contextlib.nullcontext(_StageBytes())
+
+def stage(name, nbytes=0):
+    '''
+    Context manager recording a block as a pipeline stage, a no-op while profiling is disabled.
+
+    When the byte count is only known at the end, set it on the yielded
+    object: with stage("write") as written: written.nbytes = ...
+    '''
+    if _profiler is None:
+        return _null_stage
+    return _timed_stage(_profiler, name, nbytes)
+
+def _instrumented(name):
+    # Record every call of the decorated function as a stage when profiling is enabled
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            profiler = _profiler
+            if profiler is None:
+                return func(*args, **kwargs)
+            start = time.perf_counter_ns()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                profiler.record(name, start, time.perf_counter_ns())
+        return wrapper
+    return decorate
 
 
 # Load a 3D model from a file into a VTK PolyData object
+@_instrumented("load_3d_model")
 def load_3d_model(file_path):
     # Create a VTK reader based on the file extension
     file_ext = os.path.splitext(file_path)[1].lower()
@@ -52,6 +234,7 @@ def view_model(model_data):
     render_window_interactor.Start()
     
 # Create a VTK camera view of the model
+@_instrumented("camera_view")
 def camera_view(model_data, distance=2000, init_pitch=0, init_yaw=-90, init_roll=0, randomize=False, seed=0):
     
     rng = np.random.default_rng(seed)
@@ -132,6 +315,7 @@ def camera_view(model_data, distance=2000, init_pitch=0, init_yaw=-90, init_roll
     
     return output_raw
 
+@_instrumented("vtk_to_PIL")
 def vtk_to_PIL(camera_view):
     
     img = Image.open(io.BytesIO(camera_view))
@@ -141,6 +325,541 @@ def vtk_to_PIL(camera_view):
     
     return img
 
+class RenderContext:
+    '''
+    Persistent off-screen VTK renderer for camera views of 3D models.
+
+    The render window, camera, mapper, actor and image filter are created
+    once and reused, only the model, orientation and color change per call.
+    The RGBA buffer is read straight from the window, so there is no PNG
+    encode/decode round-trip as with camera_view and vtk_to_PIL.
+    '''
+    def __init__(self, size=(1600, 1200), distance=2000):
+        self.size = size
+        self.distance = distance
+
+        # Create a VTK renderer with a transparent background
+        self.renderer = vtk.vtkRenderer()
+        self.renderer.SetBackground(0, 0, 0)
+        self.renderer.SetBackgroundAlpha(0)
+
+        # Create an off-screen render window
+        self.render_window = vtk.vtkRenderWindow()
+        self.render_window.SetOffScreenRendering(1)
+        self.render_window.SetAlphaBitPlanes(1)
+        self.render_window.AddRenderer(self.renderer)
+        self.render_window.SetSize(*size)
+
+        # Create a single mapper and actor, the model data is swapped per call
+        self.mapper = vtk.vtkPolyDataMapper()
+        self.actor = vtk.vtkActor()
+        self.actor.SetMapper(self.mapper)
+        self.renderer.AddActor(self.actor)
+
+        # Set up the camera for an orthographic view
+        self.camera = vtk.vtkCamera()
+        self.camera.SetParallelProjection(1)
+        self.renderer.SetActiveCamera(self.camera)
+
+        # Filter to read the RGBA buffer back from the window
+        self.window_filter = vtk.vtkWindowToImageFilter()
+        self.window_filter.SetInput(self.render_window)
+        self.window_filter.SetInputBufferTypeToRGBA()
+        self.window_filter.ReadFrontBufferOff()
+
+    def render(self, model_data, init_pitch=0, init_yaw=-90, init_roll=0, randomize=False, seed=0, as_array=False):
+        '''
+        Render a cropped RGBA view of the model.
+
+        Takes the same orientation and randomization arguments as camera_view
+        and draws the random values in the same order, so the same seed gives
+        the same view. Returns a PIL image, or a (H, W, 4) uint8 array if
+        as_array is True.
+        '''
+        color, pose = random_pose(randomize=randomize, seed=seed)
+        return self.render_pose(model_data, (init_pitch, init_yaw, init_roll), pose, color, as_array=as_array)
+
+    @_instrumented("render")
+    def render_pose(self, model_data, init_pose, pose, color, as_array=False):
+        '''
+        Render a cropped RGBA view of the model at an explicit pose and color.
+
+        init_pose and pose are (pitch, yaw, roll) tuples in degrees, applied
+        in that order as in camera_view. color is an RGB tuple in [0, 1].
+        '''
+        self.mapper.SetInputData(model_data)
+        self.actor.GetProperty().SetColor(*color)
+
+        # Reset the actor, then apply the initial orientation and the pose
+        self.actor.SetOrientation(0, 0, 0)
+        for pitch, yaw, roll in (init_pose, pose):
+            self.actor.RotateX(pitch)
+            self.actor.RotateZ(yaw)
+            self.actor.RotateY(roll)
+
+        # Restore the camera before fitting it to the new actor bounds
+        self.camera.SetPosition(0, self.distance, 0)
+        self.camera.SetFocalPoint(0, 0, 0)
+        self.camera.SetViewUp(0, 0, -1)
+        self.camera.SetClippingRange(1, 10000)
+        self.camera.SetParallelScale(1000)
+        self.renderer.ResetCamera()
+        self.render_window.Render()
+
+        self.window_filter.Modified()
+        self.window_filter.Update()
+
+        return buffer_to_image(self.window_filter.GetOutput(), as_array=as_array)
+
+def random_pose(randomize=False, seed=0):
+    '''
+    Draw the model color and (pitch, yaw, roll) adjustment used by camera_view.
+    '''
+    rng = np.random.default_rng(seed)
+    if not randomize:
+        return (0.5, 0.5, 0.5), (0, 0, 0)
+
+    # Same draw order as camera_view: color first, then rotations
+    color = (rng.uniform(0.1, 0.9), rng.uniform(0.1, 0.9), rng.uniform(0.1, 0.9))
+    pose = (rng.uniform(-90, 90), rng.uniform(-180, 180), rng.uniform(-45, 45))
+    return color, pose
+
+def buffer_to_image(image_data, as_array=False):
+    '''
+    Convert a vtkImageData RGBA buffer to a cropped PIL image or numpy array.
+    '''
+    width, height, _ = image_data.GetDimensions()
+    scalars = image_data.GetPointData().GetScalars()
+
+    from vtk.util import numpy_support
+
+    # VTK stores rows bottom to top, flip to image order
+    arr = numpy_support.vtk_to_numpy(scalars).reshape(height, width, -1)[::-1]
+
+    # Crop to the non-transparent pixels
+    rows = np.flatnonzero(arr[:, :, 3].any(axis=1))
+    cols = np.flatnonzero(arr[:, :, 3].any(axis=0))
+    if rows.size == 0:
+        arr = arr[:0, :0]
+    else:
+        arr = arr[rows[0]:rows[-1] + 1, cols[0]:cols[-1] + 1]
+    arr = np.ascontiguousarray(arr)
+
+    if as_array:
+        return arr
+    return Image.fromarray(arr, "RGBA")
+
+_render_context = None
+
+def render_context(size=(1600, 1200), distance=2000):
+    '''
+    Get the render context for the current process, creating it on first use.
+    '''
+    global _render_context
+    if _render_context is None or _render_context.size != size or _render_context.distance != distance:
+        _render_context = RenderContext(size=size, distance=distance)
+    return _render_context
+
+def mesh_arrays(model_data):
+    '''
+    Get the (V, 3) float64 vertices and (T, 3) triangle indices of a PolyData model.
+    '''
+    from vtk.util import numpy_support
+
+    # Split polygons and strips into triangles
+    triangle_filter = vtk.vtkTriangleFilter()
+    triangle_filter.SetInputData(model_data)
+    triangle_filter.PassVertsOff()
+    triangle_filter.PassLinesOff()
+    triangle_filter.Update()
+    triangles_data = triangle_filter.GetOutput()
+
+    vertices = numpy_support.vtk_to_numpy(triangles_data.GetPoints().GetData()).astype(np.float64)
+    cells = triangles_data.GetPolys()
+    offsets = numpy_support.vtk_to_numpy(cells.GetOffsetsArray())
+    connectivity = numpy_support.vtk_to_numpy(cells.GetConnectivityArray())
+    triangles = connectivity.reshape(-1, 3) if len(offsets) > 1 else np.empty((0, 3), dtype=np.int64)
+    return vertices, triangles.astype(np.int64)
+
+def pose_matrix(init_pose, pose):
+    '''
+    Get the 3x3 rotation of an actor after RotateX, RotateZ, RotateY for init_pose then pose.
+    '''
+    def rotation(axis, degrees):
+        c, s = np.cos(np.radians(degrees)), np.sin(np.radians(degrees))
+        i, j = [(1, 2), (2, 0), (0, 1)][axis]
+        r = np.eye(3)
+        r[i, i], r[i, j], r[j, i], r[j, j] = c, -s, s, c
+        return r
+
+    # vtkProp3D rotations are about the actor's own axes, so each one post-multiplies
+    matrix = np.eye(3)
+    for pitch, yaw, roll in (init_pose, pose):
+        matrix = matrix @ rotation(0, pitch) @ rotation(2, yaw) @ rotation(1, roll)
+    return matrix
+
+@_instrumented("rasterize")
+def rasterize_mesh(mesh, init_pose, pose, color, width, shading="flat", supersample=2, as_array=False):
+    '''
+    Rasterize a cropped RGBA sprite of a mesh directly at a target width, without VTK rendering.
+
+    mesh is a (vertices, triangles) pair from mesh_arrays, posed as in
+    RenderContext.render_pose and projected with the same orthographic
+    camera (looking down -Y, +Z down the image). The silhouette is scaled
+    so it spans exactly width pixels. shading is "flat" (the VTK headlight,
+    two-sided) or "silhouette" (solid color). Edges are antialiased by
+    rasterizing at supersample times the size and averaging the coverage.
+    Returns a PIL image, or a (H, W, 4) uint8 array if as_array is True.
+    '''
+    vertices, triangles = mesh
+    world = vertices @ pose_matrix(init_pose, pose).T
+
+    # Screen x is world X, screen y is world Z, depth grows towards the camera (+Y)
+    screen = world[:, [0, 2]]
+    low, high = screen.min(axis=0), screen.max(axis=0)
+    extent = np.maximum(high - low, 1e-12)
+    sub_width = max(1, int(width)) * supersample
+    scale = sub_width / extent[0]
+    sub_height = max(1, int(np.ceil(extent[1] * scale / supersample))) * supersample
+    points = (screen - low) * scale
+
+    corners = points[triangles]
+    depth = world[:, 1][triangles]
+    if shading == "flat":
+        normals = np.cross(world[triangles[:, 1]] - world[triangles[:, 0]], world[triangles[:, 2]] - world[triangles[:, 0]])
+        lengths = np.linalg.norm(normals, axis=1)
+        shade = np.abs(normals[:, 1]) / np.where(lengths > 0, lengths, 1)
+    else:
+        shade = np.ones(len(triangles))
+
+    front_triangle = _rasterize_triangles(corners, depth, sub_width, sub_height)
+
+    # Average the supersampled coverage and color into the output pixels
+    covered = front_triangle >= 0
+    intensity = np.where(covered, shade[np.maximum(front_triangle, 0)], 0.0)
+    height, width = sub_height // supersample, sub_width // supersample
+    coverage = covered.reshape(height, supersample, width, supersample).mean(axis=(1, 3))
+    intensity = intensity.reshape(height, supersample, width, supersample).sum(axis=(1, 3))
+    intensity = intensity / np.maximum(covered.reshape(height, supersample, width, supersample).sum(axis=(1, 3)), 1)
+
+    arr = np.empty((height, width, 4), dtype=np.uint8)
+    arr[..., :3] = np.rint(intensity[..., None] * np.asarray(color) * 255)
+    arr[..., 3] = np.rint(coverage * 255)
+    if as_array:
+        return arr
+    return Image.fromarray(arr, "RGBA")
+
+def _rasterize_triangles(corners, depth, width, height, max_samples=2**22):
+    # Z-buffered coverage of (T, 3, 2) pixel-space triangles, sampled at pixel centers.
+    # Every (triangle, pixel in its bounding box) pair is tested at once, in chunks.
+    # Returns a (height, width) array with the front triangle per pixel, or -1.
+    a, b, c = corners[:, 0], corners[:, 1], corners[:, 2]
+    area = (b[:, 0] - a[:, 0]) * (c[:, 1] - a[:, 1]) - (b[:, 1] - a[:, 1]) * (c[:, 0] - a[:, 0])
+
+    lo = np.ceil(corners.min(axis=1) - 0.5).astype(np.int64)
+    hi = np.floor(corners.max(axis=1) - 0.5).astype(np.int64)
+    lo = np.maximum(lo, 0)
+    hi = np.minimum(hi, [width - 1, height - 1])
+    box_w = np.maximum(hi[:, 0] - lo[:, 0] + 1, 0)
+    box_h = np.maximum(hi[:, 1] - lo[:, 1] + 1, 0)
+    samples = box_w * box_h
+    visible = np.flatnonzero((samples > 0) & (area != 0))
+
+    pixels, depths, owners = [], [], []
+    total = np.cumsum(samples[visible])
+    start = 0
+    while start < len(visible):
+        # Take triangles until about max_samples pixel tests, at least one
+        done = total[start - 1] if start else 0
+        stop = max(int(np.searchsorted(total, done + max_samples, side='right')), start + 1)
+        chunk = visible[start:stop]
+        start = stop
+
+        owner = np.repeat(chunk, samples[chunk])
+        first = np.repeat(np.cumsum(samples[chunk]) - samples[chunk], samples[chunk])
+        local = np.arange(len(owner)) - first
+        ix = lo[owner, 0] + local % box_w[owner]
+        iy = lo[owner, 1] + local // box_w[owner]
+        px, py = ix + 0.5, iy + 0.5
+
+        # Barycentric weights from edge functions, normalized by the signed area
+        w0 = ((c[owner, 0] - b[owner, 0]) * (py - b[owner, 1]) - (c[owner, 1] - b[owner, 1]) * (px - b[owner, 0])) / area[owner]
+        w1 = ((a[owner, 0] - c[owner, 0]) * (py - c[owner, 1]) - (a[owner, 1] - c[owner, 1]) * (px - c[owner, 0])) / area[owner]
+        w2 = 1 - w0 - w1
+        inside = (w0 >= 0) & (w1 >= 0) & (w2 >= 0)
+
+        owner = owner[inside]
+        pixels.append(iy[inside] * width + ix[inside])
+        depths.append(w0[inside] * depth[owner, 0] + w1[inside] * depth[owner, 1] + w2[inside] * depth[owner, 2])
+        owners.append(owner)
+
+    front = np.full(width * height, -1, dtype=np.int64)
+    if pixels:
+        pixels, depths, owners = np.concatenate(pixels), np.concatenate(depths), np.concatenate(owners)
+    if len(pixels):
+        # Sort by pixel then depth, the last entry of each pixel is nearest the camera
+        order = np.lexsort((depths, pixels))
+        pixels = pixels[order]
+        last = np.append(pixels[1:] != pixels[:-1], True)
+        front[pixels[last]] = owners[order][last]
+    return front.reshape(height, width)
+
+class SpriteCache:
+    '''
+    Cache of rendered, cropped RGBA model sprites keyed on a discretized pose.
+
+    Keys are (model name, initial orientation, quantized pitch/yaw/roll,
+    color bucket). Sprites are rendered once in a neutral white and tinted to
+    the color bucket on lookup, since the flat diffuse shading scales
+    linearly with the model color. There are two tiers:
+    - an in-memory LRU of tinted and neutral sprites, bounded by max_bytes
+    - an optional on-disk store of neutral sprites, one .npy file per sprite
+      under cache_dir/<model name>/, only ever added to, so concurrent
+      workers never overwrite each other's sprites
+    Sprites rendered on a miss are kept pending until flush is called.
+    Atlases written as cache_dir/<model name>.npz by earlier versions are
+    still read.
+    '''
+    def __init__(self, cache_dir=None, max_bytes=512 * 2**20, angle_step=15, color_levels=8):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.angle_step = angle_step
+        self.color_levels = color_levels
+
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._atlases = {}
+        self._pending = {}
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def quantize_pose(self, pose):
+        '''
+        Snap a (pitch, yaw, roll) tuple to the cache grid.
+        '''
+        step = self.angle_step
+        pitch, yaw, roll = (int(round(angle / step)) * step for angle in pose)
+        # Wrap yaw into [-180, 180)
+        yaw = (yaw + 180) % 360 - 180
+        return (pitch, yaw, roll)
+
+    def color_bucket(self, color):
+        '''
+        Snap an RGB color in [0.1, 0.9] to one of color_levels per channel.
+        '''
+        levels = self.color_levels - 1
+        return tuple(int(round(np.clip((c - 0.1) / 0.8, 0, 1) * levels)) for c in color)
+
+    def bucket_color(self, bucket):
+        '''
+        Get the RGB color at the center of a color bucket.
+        '''
+        levels = self.color_levels - 1
+        return tuple(0.1 + 0.8 * b / levels for b in bucket)
+
+    def sprite(self, model_name, model_data, init_pitch=0, init_yaw=-90, init_roll=0, randomize=False, seed=0, as_array=False):
+        '''
+        Get a sprite for the pose and color camera_view would draw for the seed.
+        '''
+        color, pose = random_pose(randomize=randomize, seed=seed)
+        return self.get(model_name, model_data, (init_pitch, init_yaw, init_roll), pose, color, as_array=as_array)
+
+    def get(self, model_name, model_data, init_pose, pose, color, as_array=False):
+        '''
+        Get a sprite at the nearest cached pose and color bucket, rendering on a miss.
+        '''
+        init_pose = tuple(init_pose)
+        pose = self.quantize_pose(pose)
+        bucket = self.color_bucket(color)
+        key = (model_name, init_pose, pose, bucket)
+
+        arr = self._memory_get(key)
+        if arr is None:
+            neutral = self._neutral(model_name, model_data, init_pose, pose)
+            arr = tint_sprite(neutral, self.bucket_color(bucket))
+            self._memory_put(key, arr)
+        else:
+            self.hits += 1
+
+        if as_array:
+            return arr
+        return Image.fromarray(arr, "RGBA")
+
+    def prewarm(self, model_files, init_poses=None, workers=None):
+        '''
+        Render the full orientation grid for each model file in parallel.
+
+        model_files is a list of 3D model paths, the model name is the file
+        name without extension. init_poses optionally maps a model name to its
+        initial (pitch, yaw, roll). If cache_dir is set, the workers write
+        the neutral sprites straight to the disk store, otherwise they are
+        added to the memory tier, so the grid is never held in memory at once.
+        '''
+        init_poses = init_poses or {}
+        grid = self.pose_grid()
+
+        tasks = []
+        for path in model_files:
+            name = os.path.splitext(os.path.basename(path))[0]
+            init_pose = tuple(init_poses.get(name, (0, -90, 0)))
+            todo = [pose for pose in grid if not self._has_neutral(name, init_pose, pose)]
+            # Split each model's grid into chunks so all workers stay busy
+            chunk = max(1, len(todo) // (4 * (workers or os.cpu_count() or 1)))
+            for i in range(0, len(todo), chunk):
+                tasks.append((path, name, init_pose, todo[i:i + chunk], self.cache_dir))
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for name, init_pose, sprites in executor.map(_render_pose_chunk, tasks):
+                for pose, arr in sprites:
+                    if arr is not None:
+                        self._memory_put((name, init_pose, pose, None), arr)
+
+    def pose_grid(self):
+        '''
+        Get every quantized (pitch, yaw, roll) within the camera_view ranges.
+        '''
+        step = self.angle_step
+        pitches = range(-(90 // step) * step, 91, step)
+        yaws = range(-(180 // step) * step, 180, step)
+        rolls = range(-(45 // step) * step, 46, step)
+        return [(p, y, r) for p in pitches for y in yaws for r in rolls]
+
+    def flush(self):
+        '''
+        Write newly rendered neutral sprites to the disk store, one file each.
+        '''
+        if self.cache_dir is not None:
+            for model_name, entries in self._pending.items():
+                for atlas_key, arr in entries.items():
+                    _write_sprite(self._sprite_path(model_name, atlas_key), arr)
+        self._pending.clear()
+
+    def stats(self):
+        '''
+        Get hit and miss counts for the cache.
+        '''
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            "memory_items": len(self._memory),
+            "memory_bytes": self._memory_bytes,
+        }
+
+    def _neutral(self, model_name, model_data, init_pose, pose):
+        neutral_key = (model_name, init_pose, pose, None)
+        arr = self._memory_get(neutral_key)
+        if arr is not None:
+            self.hits += 1
+            return arr
+
+        arr = self._disk_get(model_name, init_pose, pose)
+        if arr is not None:
+            self.disk_hits += 1
+        else:
+            self.misses += 1
+            arr = render_context().render_pose(model_data, init_pose, pose, (1.0, 1.0, 1.0), as_array=True)
+            self._pending.setdefault(model_name, {})[_atlas_key(init_pose, pose)] = arr
+        self._memory_put(neutral_key, arr)
+        return arr
+
+    def _has_neutral(self, model_name, init_pose, pose):
+        if (model_name, init_pose, pose, None) in self._memory:
+            return True
+        if self.cache_dir is None:
+            return False
+        atlas_key = _atlas_key(init_pose, pose)
+        if os.path.exists(self._sprite_path(model_name, atlas_key)):
+            return True
+        atlas = self._atlas(model_name)
+        return atlas is not None and atlas_key in atlas.files
+
+    def _memory_get(self, key):
+        arr = self._memory.get(key)
+        if arr is not None:
+            self._memory.move_to_end(key)
+        return arr
+
+    def _memory_put(self, key, arr):
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_bytes -= old.nbytes
+        self._memory[key] = arr
+        self._memory_bytes += arr.nbytes
+        # Evict least recently used sprites until back under the budget
+        while self._memory_bytes > self.max_bytes and len(self._memory) > 1:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= evicted.nbytes
+
+    def _disk_get(self, model_name, init_pose, pose):
+        pending = self._pending.get(model_name, {})
+        atlas_key = _atlas_key(init_pose, pose)
+        if atlas_key in pending:
+            return pending[atlas_key]
+        if self.cache_dir is None:
+            return None
+        try:
+            return np.load(self._sprite_path(model_name, atlas_key))
+        except FileNotFoundError:
+            pass
+        atlas = self._atlas(model_name)
+        if atlas is None or atlas_key not in atlas.files:
+            return None
+        return atlas[atlas_key]
+
+    def _atlas(self, model_name):
+        # Read-only atlas of an earlier version of the cache
+        if model_name not in self._atlases:
+            atlas_path = self._atlas_path(model_name)
+            # NpzFile reads members lazily, only the requested sprite is loaded
+            self._atlases[model_name] = np.load(atlas_path) if os.path.exists(atlas_path) else None
+        return self._atlases[model_name]
+
+    def _atlas_path(self, model_name):
+        return os.path.join(self.cache_dir, f"{model_name}.npz")
+
+    def _sprite_path(self, model_name, atlas_key):
+        return os.path.join(self.cache_dir, model_name, f"{atlas_key}.npy")
+
+def _atlas_key(init_pose, pose):
+    return "_".join(str(int(round(a))) for a in (*init_pose, *pose))
+
+def _write_sprite(sprite_path, arr):
+    # Write to a temporary file first so a crash or a racing worker never leaves a broken sprite
+    os.makedirs(os.path.dirname(sprite_path), exist_ok=True)
+    tmp_path = f"{sprite_path}.{os.getpid()}.tmp.npy"
+    np.save(tmp_path, arr)
+    os.replace(tmp_path, sprite_path)
+
+def _render_pose_chunk(task):
+    # Worker for SpriteCache.prewarm, each process uses its own render context.
+    # With a cache_dir the sprites are written here and only the poses are sent back
+    path, name, init_pose, poses, cache_dir = task
+    model_data = load_3d_model(path)
+    ctx = render_context()
+    sprites = []
+    for pose in poses:
+        arr = ctx.render_pose(model_data, init_pose, pose, (1.0, 1.0, 1.0), as_array=True)
+        if cache_dir is not None:
+            _write_sprite(os.path.join(cache_dir, name, f"{_atlas_key(init_pose, pose)}.npy"), arr)
+            arr = None
+        sprites.append((pose, arr))
+    return name, init_pose, sprites
+
+def tint_sprite(sprite, color):
+    '''
+    Tint a neutral (white) RGBA sprite array to an RGB color in [0, 1].
+    '''
+    out = sprite.copy()
+    out[:, :, :3] = np.rint(sprite[:, :, :3] * np.asarray(color, dtype=np.float32)).astype(np.uint8)
+    return out
+
 def rng_scale(seed=0):
     rng = np.random.default_rng(seed)
     base = rng.gamma(shape=4.5, scale=0.08)
@@ -163,68 +882,402 @@ def rng_position(obj_size=(1, 1), canvas_size=(640, 480), seed=0):
     
     return (int(x_pos), int(y_pos))
 
+@_instrumented("scale_obj")
 def scale_obj(obj_image, scale, canvas_size=(640, 480)):
     obj_width, obj_height = obj_image.size
     aspect_ratio = obj_width / obj_height
     
-    new_width = int(scale * canvas_size[0])
-    new_height = int(new_width / aspect_ratio)
+    # At least 1 px, tiny scales (e.g. fitted to far away DvB boxes) would otherwise round to 0
+    new_width = max(1, int(scale * canvas_size[0]))
+    new_height = max(1, int(new_width / aspect_ratio))
     
     resized_obj = obj_image.resize((new_width, new_height), Image.BICUBIC)
     
     return resized_obj
 
+@_instrumented("paste")
+def composite(canvas, placements, class_id=0):
+    '''
+    Alpha-blend RGBA sprites onto a canvas array in place.
+
+    canvas is a (H, W, 3) uint8 array and placements a list of
+    (sprite, (x, y)) pairs, where sprite is a (h, w, 4) uint8 array and
+    (x, y) its top-left pixel. Only each sprite's region of interest is
+    touched, blending in uint16 with the sprite premultiplied by its alpha.
+    Returns the canvas and a list of YOLO boxes
+    (class, x_center, y_center, width, height) for the visible sprites.
+    '''
+    canvas_height, canvas_width = canvas.shape[:2]
+    labels = []
+
+    for sprite, (x, y) in placements:
+        height, width = sprite.shape[:2]
+
+        # Clip the sprite to the canvas
+        x0, y0 = max(x, 0), max(y, 0)
+        x1, y1 = min(x + width, canvas_width), min(y + height, canvas_height)
+        if x0 >= x1 or y0 >= y1:
+            continue
+        src = sprite[y0 - y:y1 - y, x0 - x:x1 - x]
+        roi = canvas[y0:y1, x0:x1]
+
+        alpha = src[:, :, 3:4].astype(np.uint16)
+        premultiplied = src[:, :, :3] * alpha
+        roi[...] = (premultiplied + roi * (255 - alpha) + 127) // 255
+
+        labels.append((
+            class_id,
+            (x0 + x1) / 2 / canvas_width,
+            (y0 + y1) / 2 / canvas_height,
+            (x1 - x0) / canvas_width,
+            (y1 - y0) / canvas_height,
+        ))
+
+    return canvas, labels
+
+def write_labels(file_path, labels):
+    '''
+    Write all YOLO boxes for an image in a single call, replacing the file.
+    Returns the number of bytes written.
+    '''
+    text = "".join(" ".join(str(a) for a in label) + "\n" for label in labels)
+    with open(file_path, "w") as ann_file:
+        ann_file.write(text)
+    return len(text)
+
+@_instrumented("rng_transform")
 def rng_transform(obj_image, seed=42):
-    rng = np.random.default_rng(seed)
-    
-    # Randomly select a transformation
-    rand_int = rng.integers(low=0, high=8)
-    
+    '''
+    Apply one randomly selected transformation to an object image.
+
+    The alpha channel of RGBA images is kept, the color transforms only
+    change the RGB channels.
+    '''
+    transform = draw_transform(seed)
+
     # Default no transform
-    if rand_int == 0:
+    if transform[0] == "none":
         return obj_image
-    # Flip image left-right
-    if rand_int == 1:
-        return obj_image.transpose(Image.Transpose.FLIP_LEFT_RIGHT)
-    # Flip image up-down
-    if rand_int == 2:
-        return obj_image.transpose(Image.Transpose.FLIP_TOP_BOTTOM)
-    # Apply gaussian blur
-    if rand_int == 3:
-        return obj_image.filter(ImageFilter.GaussianBlur(2))
-    # Apply smoothing
-    if rand_int == 4:
-        return obj_image.filter(ImageFilter.SMOOTH)
-    # Change hue
-    if rand_int == 5:
-        hsv_obj = obj_image.convert("HSV")
-        h, s, v = hsv_obj.split()
-        
-        h = h.point(lambda i: i * rng.uniform(0.15, 0.85))
-        
-        result_img = Image.merge("HSV", (h, s, v)).convert("RGB")
-        
-        return result_img
-    # Change saturation
-    if rand_int == 6:
-        hsv_obj = obj_image.convert("HSV")
-        h, s, v = hsv_obj.split()
-        
-        s = s.point(lambda i: i * rng.uniform(0.15, 0.85))
-        
-        result_img = Image.merge("HSV", (h, s, v)).convert("RGB")
-        
-        return result_img
-    # Change value
-    if rand_int == 7:
-        hsv_obj = obj_image.convert("HSV")
-        h, s, v = hsv_obj.split()
-        
-        v = v.point(lambda i: i * rng.uniform(0.15, 0.85))
-        
-        result_img = Image.merge("HSV", (h, s, v)).convert("RGB")
-        
-        return result_img
+
+    mode = "RGBA" if obj_image.mode in ("RGBA", "LA", "PA") or "transparency" in obj_image.info else "RGB"
+    arr = apply_transforms(np.asarray(obj_image.convert(mode)), [transform])
+    return Image.fromarray(arr, mode)
+
+def draw_transform(seed=42):
+    '''
+    Draw the transformation rng_transform applies for a seed.
+
+    Returns a tuple whose first item is the transform name, the color
+    transforms also carry the HSV channel index and a 256 entry lookup table.
+    '''
+    rng = np.random.default_rng(seed)
+
+    # Randomly select a transformation
+    return make_transform(rng.integers(low=0, high=8), rng)
+
+def make_transform(code, rng):
+    '''
+    Build transformation number code (0-7, as drawn by draw_transform),
+    drawing the lookup table of a color transform from rng.
+    '''
+    names = ("none", "flip_lr", "flip_ud", "blur", "smooth")
+    if code < len(names):
+        return (names[code],)
+
+    # Change hue, saturation or value with a random scale per lookup entry,
+    # drawn in one call instead of once per entry inside Image.point
+    channel = code - 5
+    lut = np.rint(np.arange(256) * rng.uniform(0.15, 0.85, size=256)).astype(np.uint8)
+    return ("hsv", channel, lut)
+
+def draw_transforms(seed, count):
+    '''
+    Draw the transformations of count chained rng_transform calls (seeds seed + t).
+    '''
+    return [draw_transform(seed + t) for t in range(count)]
+
+def apply_transforms(arr, transforms):
+    '''
+    Apply a sequence of drawn transformations to a (H, W, 3 or 4) uint8 array.
+
+    Consecutive color transforms share a single RGB/HSV round trip. That
+    skips the 8-bit RGB rounding between them, so a chain with adjacent
+    color transforms gives different pixels than the same transforms
+    applied one call at a time (as chained rng_transform calls do); a
+    single transform gives the same result. The alpha channel, if any, is
+    only flipped or filtered with the image.
+    '''
+    hsv = None
+    for transform in transforms:
+        name = transform[0]
+        if name == "hsv":
+            if hsv is None:
+                hsv = rgb_to_hsv(arr[:, :, :3])
+            _, channel, lut = transform
+            hsv[:, :, channel] = lut[hsv[:, :, channel]]
+            continue
+
+        # Leave HSV space before any geometric or filter transform
+        if hsv is not None:
+            arr = _merge_rgb(arr, hsv_to_rgb(hsv))
+            hsv = None
+
+        if name == "flip_lr":
+            arr = arr[:, ::-1]
+        elif name == "flip_ud":
+            arr = arr[::-1]
+        elif name in ("blur", "smooth"):
+            arr = _filter_array(arr, name)
+
+    if hsv is not None:
+        arr = _merge_rgb(arr, hsv_to_rgb(hsv))
+
+    return np.ascontiguousarray(arr)
+
+def augment_batch(sprites, seeds, counts=None):
+    '''
+    Apply chained random transformations to a batch of sprites.
+
+    sprites is a (N, H, W, C) uint8 array or a list of (H, W, C) arrays,
+    seeds holds one seed per sprite and counts the number of chained
+    transforms per sprite (default 1). Sprite n gets the transforms of
+    draw_transforms(seeds[n], counts[n]), applied one step at a time, so
+    the pixels match chained rng_transform calls for either input type. For
+    a stacked array, every color step is converted to and from HSV for all
+    affected sprites at once.
+    '''
+    counts = [1] * len(seeds) if counts is None else counts
+    plans = [draw_transforms(int(seed), int(count)) for seed, count in zip(seeds, counts)]
+
+    if not isinstance(sprites, np.ndarray):
+        out = []
+        for sprite, plan in zip(sprites, plans):
+            for transform in plan:
+                sprite = apply_transforms(sprite, [transform])
+            out.append(sprite)
+        return out
+
+    out = sprites.copy()
+    for step in range(max((len(plan) for plan in plans), default=0)):
+        hsv_idx = []
+        for n, plan in enumerate(plans):
+            if step >= len(plan):
+                continue
+            name = plan[step][0]
+            if name == "hsv":
+                hsv_idx.append(n)
+            elif name != "none":
+                out[n] = apply_transforms(out[n], [plan[step]])
+
+        if hsv_idx:
+            hsv_idx = np.asarray(hsv_idx)
+            hsv = rgb_to_hsv(out[hsv_idx, :, :, :3])
+            channels = np.array([plans[n][step][1] for n in hsv_idx])
+            luts = np.stack([plans[n][step][2] for n in hsv_idx])
+            rows = np.arange(len(hsv_idx))
+            # Look up each sprite's value through its own table
+            hsv[rows, :, :, channels] = luts[rows[:, None, None], hsv[rows, :, :, channels]]
+            out[hsv_idx, :, :, :3] = hsv_to_rgb(hsv)
+
+    return out
+
+def _merge_rgb(arr, rgb):
+    if arr.shape[2] == 3:
+        return rgb
+    return np.concatenate([rgb, arr[:, :, 3:]], axis=2)
+
+def _filter_array(arr, name):
+    # Gaussian blur and smoothing use the PIL kernels, as in the original transforms
+    image_filter = ImageFilter.GaussianBlur(2) if name == "blur" else ImageFilter.SMOOTH
+    mode = "RGBA" if arr.shape[2] == 4 else "RGB"
+    return np.asarray(Image.fromarray(np.ascontiguousarray(arr), mode).filter(image_filter))
+
+def gamma_scale(rng, size):
+    '''
+    Draw object widths as a fraction of the canvas width, as rng_scale does.
+    '''
+    return 0.002 + rng.gamma(shape=4.5, scale=0.08, size=size) / 8
+
+def sigmoid_position(rng, size):
+    '''
+    Draw (size, 2) positions in [0, 1] of the canvas space left free by the object, as rng_position does.
+    '''
+    return 1 / (1 + np.exp(-rng.normal(size=(size, 2))))
+
+class BoxDistribution:
+    '''
+    Box statistics fitted to real annotations, for placing synthetic objects.
+
+    data is the annotations_data.csv table of the data exploration notebook
+    (or its path, or an (N, 4) array) with x_center, y_center, width and
+    height columns, normalized to the frame. The joint distribution is
+    either a histogram of the column ranks ('histogram', a drawn cell is
+    mapped back through each column's quantiles, so the marginals are kept
+    exactly and the dependence at bins resolution) or a Gaussian KDE with
+    Scott's rule bandwidths ('kde', samples are a drawn box plus noise).
+    Calling it with (rng, size) returns a (size, 4) array of the columns.
+    '''
+    columns = ('x_center', 'y_center', 'width', 'height')
+
+    def __init__(self, data, method='histogram', bins=16):
+        if method not in ('histogram', 'kde'):
+            raise ValueError(f"Unsupported box distribution: {method}")
+        if isinstance(data, str):
+            import pandas as pd
+            data = pd.read_csv(data)
+        if hasattr(data, 'columns'):
+            data = data[list(self.columns)].to_numpy()
+        values = np.clip(np.asarray(data, dtype=np.float64).reshape(-1, 4), 0, 1)
+
+        self.method = method
+        self.lower = values.min(axis=0)
+        self.upper = values.max(axis=0)
+        if method == 'kde':
+            self.values = values
+            self.bandwidth = values.std(axis=0) * len(values) ** (-1 / (values.shape[1] + 4))
+        else:
+            # Bin ranks rather than values, so the long width and height tails get no wide cells
+            self.grid = np.linspace(0, 1, 1025)
+            self.quantiles = np.quantile(values, self.grid, axis=0)
+            ranks = np.argsort(np.argsort(values, axis=0), axis=0) / len(values)
+            counts, _ = np.histogramdd(ranks, bins=bins, range=[(0, 1)] * 4)
+            self.cells = np.flatnonzero(counts)
+            self.probs = counts.ravel()[self.cells] / counts.sum()
+            self.shape = counts.shape
+
+    def __call__(self, rng, size):
+        if self.method == 'kde':
+            picks = self.values[rng.integers(len(self.values), size=size)]
+            return np.clip(picks + rng.normal(size=picks.shape) * self.bandwidth, self.lower, self.upper)
+
+        cells = np.stack(np.unravel_index(self.cells[rng.choice(len(self.cells), size=size, p=self.probs)], self.shape), axis=1)
+        ranks = (cells + rng.random((size, 4))) / np.array(self.shape)
+        return np.stack([np.interp(ranks[:, d], self.grid, self.quantiles[:, d]) for d in range(4)], axis=1)
+
+def plan_placements(n, num_canvases, num_objects, seed=0, max_objects=5, max_transforms=3,
+                    scale=gamma_scale, position=sigmoid_position, boxes=None, plan_file=None):
+    '''
+    Draw the canvas, objects and object placements of a whole dataset at once.
+
+    Every random value of n images is drawn as an array from a single
+    generator seeded with seed: the canvas index and object count per image,
+    and per object the object index, scale (width as a fraction of the
+    canvas width), position (fraction of the free canvas space, as in
+    rng_position), color, pose and the chain of transformations. scale and
+    position are distributions called with (rng, size), by default the
+    shapes of rng_scale and rng_position. boxes is an optional
+    BoxDistribution that draws scale and position together instead, then
+    position holds the normalized box center (plan.centered is set) and
+    the sprite is centered on it, kept inside the canvas. Returns a
+    PlacementPlan, saved to plan_file when given, for generate_dataset's "plan".
+    '''
+    rng = np.random.default_rng(seed)
+    counts = rng.integers(low=1, high=max_objects + 1, size=n)
+    total = int(counts.sum())
+
+    plan = PlacementPlan()
+    plan.sizes = np.array([num_canvases, num_objects], dtype=np.int64)
+    plan.canvas = rng.integers(num_canvases, size=n).astype(np.int32)
+    plan.obj_ptr = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+    plan.obj = rng.integers(num_objects, size=total).astype(np.int32)
+    if boxes is not None:
+        drawn = boxes(rng, total)
+        plan.position, plan.scale = drawn[:, :2], drawn[:, 2]
+        plan.centered = np.array(True)
+    else:
+        plan.scale = scale(rng, total)
+        plan.position = position(rng, total)
+    plan.scale = np.asarray(plan.scale, dtype=np.float32)
+    plan.position = np.asarray(plan.position, dtype=np.float32)
+    # Same ranges as random_pose
+    plan.color = rng.uniform(0.1, 0.9, size=(total, 3)).astype(np.float32)
+    plan.pose = (rng.uniform(-1, 1, size=(total, 3)) * [90, 180, 45]).astype(np.float32)
+
+    num_transforms = rng.integers(low=0, high=max_transforms + 1, size=total)
+    plan.transform_ptr = np.concatenate([[0], np.cumsum(num_transforms)]).astype(np.int64)
+    plan.transform = rng.integers(low=0, high=8, size=int(num_transforms.sum())).astype(np.int8)
+    plan.lut_seed = rng.integers(2**32, size=len(plan.transform), dtype=np.uint32)
+    if plan_file is not None:
+        plan.save(plan_file)
+    return plan
+
+class PlacementPlan:
+    '''
+    Per-image object placements stored as flat arrays.
+
+    Object o of image i is o in range(obj_ptr[i], obj_ptr[i + 1]) and its
+    transformation chain transform[transform_ptr[o]:transform_ptr[o + 1]],
+    with the lookup table of each color transform drawn from its lut_seed.
+    A plan only holds numbers, so a dataset of any size is reproduced from
+    a file of a few MB, and any range of images can be generated
+    independently, e.g. on several machines.
+    '''
+    keys = ('sizes', 'canvas', 'obj_ptr', 'obj', 'scale', 'position', 'centered', 'color', 'pose',
+            'transform_ptr', 'transform', 'lut_seed')
+
+    def __init__(self, plan_file=None):
+        self.sizes = np.zeros(2, dtype=np.int64)
+        self.canvas = np.empty(0, dtype=np.int32)
+        self.obj_ptr = np.zeros(1, dtype=np.int64)
+        self.obj = np.empty(0, dtype=np.int32)
+        self.scale = np.empty(0, dtype=np.float32)
+        self.position = np.empty((0, 2), dtype=np.float32)
+        # Positions are fractions of the free canvas space, or object centers if centered
+        self.centered = np.array(False)
+        self.color = np.empty((0, 3), dtype=np.float32)
+        self.pose = np.empty((0, 3), dtype=np.float32)
+        self.transform_ptr = np.zeros(1, dtype=np.int64)
+        self.transform = np.empty(0, dtype=np.int8)
+        self.lut_seed = np.empty(0, dtype=np.uint32)
+
+        if plan_file is not None:
+            with np.load(plan_file) as plan:
+                for key in self.keys:
+                    if key in plan.files:
+                        setattr(self, key, plan[key])
+
+    def __len__(self):
+        return len(self.canvas)
+
+    def save(self, plan_file):
+        '''
+        Save the plan to an .npz file.
+        '''
+        tmp_file = f"{plan_file}.{os.getpid()}.tmp.npz"
+        np.savez_compressed(tmp_file, **{key: getattr(self, key) for key in self.keys})
+        os.replace(tmp_file, plan_file)
+
+    def objects(self, image):
+        '''
+        Iterate the (object index, scale, position, color, pose, transforms) of an image's objects.
+        '''
+        for o in range(self.obj_ptr[image], self.obj_ptr[image + 1]):
+            start, stop = self.transform_ptr[o], self.transform_ptr[o + 1]
+            transforms = [make_transform(code, np.random.default_rng(int(lut_seed)))
+                          for code, lut_seed in zip(self.transform[start:stop].tolist(), self.lut_seed[start:stop])]
+            yield (int(self.obj[o]), float(self.scale[o]), tuple(self.position[o].tolist()),
+                   tuple(self.color[o].tolist()), tuple(self.pose[o].tolist()), transforms)
+
+def rgb_to_hsv(rgb):
+    '''
+    Convert a (..., H, W, 3) uint8 RGB array to HSV with PIL's converter.
+
+    Leading dimensions are folded into the rows of one image, so a whole
+    stack of sprites is converted in a single call.
+    '''
+    return _convert_stack(rgb, "RGB", "HSV")
+
+def hsv_to_rgb(hsv):
+    '''
+    Convert a (..., H, W, 3) uint8 HSV array to RGB with PIL's converter.
+    '''
+    return _convert_stack(hsv, "HSV", "RGB")
+
+def _convert_stack(arr, mode, target):
+    shape = arr.shape
+    flat = np.ascontiguousarray(arr).reshape(-1, shape[-2], 3)
+    converted = Image.fromarray(flat, mode).convert(target)
+    return np.array(converted).reshape(shape)
 
 def canvas_prompt(terrain, time_of_day, condition, season, seed=0):
     rng = np.random.default_rng(seed)
@@ -283,11 +1336,157 @@ def object_genai(client, prompt, number_of_images):
     
     return response.generated_images
 
+class TokenBucket:
+    '''
+    Asyncio token bucket allowing rate requests per second with bursts of up to capacity.
+    '''
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+def genai_jobs(kind, prompt_options, n, seed=0, number_of_images=1):
+    '''
+    Build n generation jobs with canvas_prompt or object_prompt.
+
+    kind is "canvas" or "object" and prompt_options the keyword arguments of
+    the matching prompt function. Each job is a dict with its prompt and a
+    key hashing the kind, prompt, number of images and how often the same
+    prompt came before it, so repeated prompts still give distinct images
+    while a rerun maps every job to the same key.
+    '''
+    prompt_fn = {"canvas": canvas_prompt, "object": object_prompt}[kind]
+    seeds = np.random.SeedSequence(seed).spawn(n)
+
+    jobs = []
+    seen = {}
+    for i in range(n):
+        prompt = prompt_fn(**prompt_options, seed=seeds[i])
+        repeat = seen.get(prompt, 0)
+        seen[prompt] = repeat + 1
+        key = hashlib.sha1(f"{kind}|{prompt}|{number_of_images}|{repeat}".encode()).hexdigest()
+        jobs.append({"index": i, "kind": kind, "prompt": prompt, "number_of_images": number_of_images, "key": key})
+    return jobs
+
+async def genai_batch_async(client, jobs, out_dir, concurrency=4, rate=0.5, burst=1, retries=5,
+                            backoff=2.0, max_backoff=60.0, prefix="genai_"):
+    '''
+    Run generation jobs concurrently, writing images to out_dir as they arrive.
+
+    Requests go through canvas_genai or object_genai in worker threads, at
+    most concurrency at a time and no faster than the token bucket allows.
+    Failed requests are retried with exponential backoff and jitter, except
+    client errors that cannot succeed on a retry (HTTP 4xx other than 408
+    and 429, e.g. authentication or invalid arguments). A response without
+    images (e.g. safety filtered) and errors writing the images fail only
+    that job. Every completed job is appended to
+    out_dir/genai_manifest.jsonl, jobs whose key is already in it are
+    skipped, so a rerun only requests missing work. client only needs
+    client.models.generate_images, so a local stub works. Returns counts of
+    generated, skipped and failed jobs plus the failures.
+    '''
+    os.makedirs(out_dir, exist_ok=True)
+    manifest_path = os.path.join(out_dir, "genai_manifest.jsonl")
+    done = set()
+    if os.path.exists(manifest_path):
+        with open(manifest_path, "r") as manifest_file:
+            done = {json.loads(line)["key"] for line in manifest_file if line.strip()}
+
+    todo = [job for job in jobs if job["key"] not in done]
+    bucket = TokenBucket(rate, burst)
+    semaphore = asyncio.Semaphore(concurrency)
+    generate = {"canvas": canvas_genai, "object": object_genai}
+    summary = {"generated": 0, "skipped": len(jobs) - len(todo), "failed": 0, "errors": {}}
+
+    def fail(job, error):
+        summary["failed"] += 1
+        summary["errors"][job["key"]] = repr(error)
+
+    with open(manifest_path, "a") as manifest_file:
+        async def run(job):
+            async with semaphore:
+                for attempt in range(retries + 1):
+                    await bucket.acquire()
+                    try:
+                        images = await asyncio.to_thread(generate[job["kind"]], client, job["prompt"], job["number_of_images"])
+                        break
+                    except Exception as e:
+                        if attempt == retries or not _retryable(e):
+                            fail(job, e)
+                            return
+                        delay = min(max_backoff, backoff * 2 ** attempt)
+                        await asyncio.sleep(delay * random.uniform(0.5, 1.0))
+
+            if not images or any(getattr(getattr(g, "image", None), "image_bytes", None) is None for g in images):
+                fail(job, ValueError("Response without image bytes, e.g. safety filtered"))
+                return
+            try:
+                file_names = await asyncio.to_thread(_write_genai_images, images, out_dir, f"{prefix}{job['key'][:16]}")
+            except OSError as e:
+                fail(job, e)
+                return
+            # Only the event loop thread appends, one line per finished job
+            manifest_file.write(json.dumps({**job, "files": file_names}) + "\n")
+            manifest_file.flush()
+            summary["generated"] += 1
+
+        # A job that still raises must not cancel the rest of the batch
+        for job, result in zip(todo, await asyncio.gather(*(run(job) for job in todo), return_exceptions=True)):
+            if isinstance(result, Exception):
+                fail(job, result)
+
+    return summary
+
+def genai_batch(client, jobs, out_dir, **kwargs):
+    '''
+    Blocking wrapper of genai_batch_async, also usable from a running event loop (e.g. Jupyter).
+    '''
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(genai_batch_async(client, jobs, out_dir, **kwargs))
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, genai_batch_async(client, jobs, out_dir, **kwargs)).result()
+
+def _retryable(error):
+    # google.genai errors carry the HTTP status as code, other clients may use status_code
+    code = getattr(error, "code", None) or getattr(error, "status_code", None)
+    if isinstance(code, int) and 400 <= code < 500:
+        return code in (408, 429)
+    return not isinstance(error, (PermissionError, ValueError, TypeError))
+
+def _write_genai_images(images, out_dir, base_name):
+    # Write each generated image atomically, keeping the encoded bytes as returned
+    file_names = []
+    for j, generated in enumerate(images):
+        image = generated.image
+        ext = ".jpg" if getattr(image, "mime_type", None) == "image/jpeg" else ".png"
+        file_name = f"{base_name}_{j}{ext}"
+        tmp_path = os.path.join(out_dir, f"{file_name}.{os.getpid()}.tmp")
+        with open(tmp_path, "wb") as image_file:
+            image_file.write(image.image_bytes)
+        os.replace(tmp_path, os.path.join(out_dir, file_name))
+        file_names.append(file_name)
+    return file_names
+
+@_instrumented("object_mask")
 def object_mask(obj_image):    
-    # Convert image channels to numpy arrays
-    red_arr = np.array(obj_image.split()[0])
-    green_arr = np.array(obj_image.split()[1])
-    blue_arr = np.array(obj_image.split()[2])
+    # Convert image channels to a single numpy array
+    rgb_arr = np.asarray(obj_image.convert("RGB"))
+    red_arr, green_arr, blue_arr = rgb_arr[:, :, 0], rgb_arr[:, :, 1], rgb_arr[:, :, 2]
     
     # Create a blank binary mask
     mask = np.zeros(green_arr.shape, dtype=np.uint8)
@@ -300,30 +1499,19 @@ def object_mask(obj_image):
 
     return binary_mask
 
+@_instrumented("object_alpha")
 def object_alpha(obj_image, obj_mask):
     # Ensure both images are in RGBA mode
-    obj_image = obj_image.convert("RGBA")
-    obj_mask = obj_mask.convert("L")  # Convert mask to grayscale
-
-    # Create a new image for output
-    output_image = Image.new("RGBA", obj_image.size)
-
-    # Get pixel data
-    obj_pixels = obj_image.load()
-    mask_pixels = obj_mask.load()
-    output_pixels = output_image.load()
-
-    # Apply the mask to the object image
-    for y in range(obj_image.height):
-        for x in range(obj_image.width):
-            r, g, b, a = obj_pixels[x, y]
-            mask_value = mask_pixels[x, y]
-            if mask_value == 0:
-                output_pixels[x, y] = (r, g, b, 255)  # Keep original pixel with full opacity
-            else:
-                output_pixels[x, y] = (0, 0, 0, 0)      # Set pixel to transparent
+    obj_arr = np.array(obj_image.convert("RGBA"))
+    mask_arr = np.asarray(obj_mask.convert("L"))  # Convert mask to grayscale
 
-    return output_image
+    # Keep original pixels with full opacity where the mask is 0,
+    # everything else becomes fully transparent
+    background = mask_arr != 0
+    obj_arr[:, :, 3] = 255
+    obj_arr[background] = 0
+
+    return Image.fromarray(obj_arr, "RGBA")
 
 def object_crop(obj_image):
     # Get bounding box of non-transparent pixels
@@ -332,4 +1520,308 @@ def object_crop(obj_image):
     # Crop the image to the bounding box
     cropped_image = obj_image.crop(bbox)
     
-    return cropped_image
\ No newline at end of file
+    return cropped_image
+
+@_instrumented("chroma_key")
+def chroma_key(obj_image, soft=False, edge=48, feather=0, despill=False, as_array=False):
+    '''
+    Matte a green-screen object image to RGBA in a single vectorized pass.
+
+    With soft=False this matches object_mask followed by object_alpha. With
+    soft=True the alpha ramps from opaque to transparent as the green excess
+    (green minus the brighter of red and blue) grows from 0 to edge. feather
+    blurs the alpha by that radius to widen the edge band, and despill clamps
+    green to the brighter of red and blue on the pixels that are kept.
+    '''
+    rgb = np.asarray(obj_image.convert("RGB"))
+    out = np.empty(rgb.shape[:2] + (4,), dtype=np.uint8)
+
+    # Green excess over the brighter of the other two channels
+    red_blue = np.maximum(rgb[:, :, 0], rgb[:, :, 2])
+    excess = rgb[:, :, 1].astype(np.int16) - red_blue
+
+    if soft:
+        alpha = np.clip(255 - excess * (255.0 / edge), 0, 255).astype(np.uint8)
+    else:
+        alpha = np.where(excess > 0, 0, 255).astype(np.uint8)
+
+    if feather > 0:
+        alpha = np.asarray(Image.fromarray(alpha).filter(ImageFilter.GaussianBlur(feather)))
+
+    out[:, :, :3] = rgb
+    if despill:
+        out[:, :, 1] = np.minimum(rgb[:, :, 1], red_blue)
+    out[:, :, 3] = alpha
+
+    # Fully transparent pixels carry no color, as with object_alpha
+    out[alpha == 0] = 0
+
+    if as_array:
+        return out
+    return Image.fromarray(out, "RGBA")
+
+def matte_directory(input_dir, output_dir, workers=8, **kwargs):
+    '''
+    Matte and crop every clip-art image in a directory into RGBA PNG sprites.
+
+    Decoding, matting and encoding run on a thread pool (PIL and numpy
+    release the GIL for the heavy parts). Sprites newer than their source
+    image are reused, so reruns only process new or changed clip-art. Extra
+    keyword arguments are passed to chroma_key. Returns the sprite paths.
+    '''
+    os.makedirs(output_dir, exist_ok=True)
+    file_ext = ('.png', '.jpg', '.jpeg', '.gif', '.bmp')
+    sources = sorted(f for f in os.listdir(input_dir) if os.path.splitext(f)[1].lower() in file_ext)
+
+    def matte_one(file_name):
+        src_path = os.path.join(input_dir, file_name)
+        dest_path = os.path.join(output_dir, os.path.splitext(file_name)[0] + ".png")
+        if os.path.exists(dest_path) and os.path.getmtime(dest_path) >= os.path.getmtime(src_path):
+            return dest_path
+        with Image.open(src_path) as img:
+            sprite = object_crop(chroma_key(img, **kwargs))
+        sprite.save(dest_path, format="PNG")
+        return dest_path
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(matte_one, sources))
+
+def generate_dataset(spec, n, out_dir, workers=None, chunksize=8, images=None):
+    '''
+    Generate n synthetic images and YOLO label files across a process pool.
+
+    spec is a dict describing the dataset:
+    - "kind": "3d_model" or "clip_art"
+    - "canvases": list of background image paths
+    - "objects": list of 3D model files or clip-art image files
+    - "seed": root seed for the dataset (default 0)
+    - "prefix": output file name prefix (default "synth_img_")
+    - "max_objects": maximum objects per image (default 5)
+    - "max_transforms": maximum rng_transform calls per clip-art object (default 3)
+    - "init_poses": optional dict of model name to initial (pitch, yaw, roll)
+    - "sprite_cache": optional directory for a per-worker SpriteCache,
+      ideally prewarmed, workers write each image's new sprites to it
+    - "canvas_cache": optional directory for a files.CanvasCache of decoded
+      backgrounds shared by all workers
+    - "canvas_cache_bytes": size budget of the canvas cache (default 2 GB)
+    - "renderer": "vtk" (default) or "raster" to draw 3D model sprites with
+      rasterize_mesh directly at their final size, without an OpenGL context
+    - "output": "full" (default), "tiles" or "both", tiles are cut from the
+      in-memory composite with image_data.tile_array, so a tiled dataset
+      never writes or re-reads the full-size image. Images below the
+      tiling min_size are written full size instead, as tile_image leaves them
+    - "tiling": optional tile_array arguments (rows, cols, overlap, min_visible, min_size)
+    - "tile_dir": directory for the tiles (default out_dir)
+    - "plan": optional PlacementPlan (or its file) from plan_placements for
+      the canvases and objects of the spec, image i then takes its canvas,
+      objects, scales, positions, poses, colors and transformations from
+      row i of the plan instead of drawing them
+
+    Each image gets its own child of np.random.SeedSequence(seed), so the
+    output is identical for any number of workers. images optionally limits
+    the run to some image indices, e.g. one chunk of a dataset. Images whose outputs
+    (.png and .txt of the full image or, when only tiling, of the last
+    tile) already exist are skipped, so an interrupted run can be resumed by calling this again
+    with the same arguments. If profiling is enabled (enable_profiling),
+    the workers' stage stats are merged into this process's profiler.
+    '''
+    os.makedirs(out_dir, exist_ok=True)
+    prefix = spec.get("prefix", "synth_img_")
+    seeds = np.random.SeedSequence(spec.get("seed", 0)).spawn(n)
+    if spec.get("plan") is not None:
+        plan = spec["plan"]
+        plan = PlacementPlan(plan) if isinstance(plan, str) else plan
+        if len(plan) < n or plan.sizes.tolist() != [len(spec["canvases"]), len(spec["objects"])]:
+            raise ValueError("The placement plan does not match the dataset spec")
+    images = range(n) if images is None else images
+
+    # Resume: only generate images that are not already complete on disk
+    output = spec.get("output", "full")
+    tiling = spec.get("tiling", {})
+    last_tile = f"_{tiling.get('rows', 2) - 1}{tiling.get('cols', 2) - 1}"
+    # The full image is written last, and instead of the tiles for images too small to tile
+    done_paths = [os.path.join(out_dir, prefix + "{:05d}")]
+    if output == "tiles":
+        done_paths.append(os.path.join(spec.get("tile_dir", out_dir), prefix + "{:05d}" + last_tile))
+    todo = [
+        (i, seeds[i]) for i in images
+        if not any(os.path.exists(path.format(i) + ".png") and os.path.exists(path.format(i) + ".txt") for path in done_paths)
+    ]
+
+    if workers == 1:
+        _init_generator(spec, out_dir)
+        for task in todo:
+            _generate_image(task)
+    else:
+        # Workers profile when this process does and send their stats back with each image
+        profile = {"trace": _profiler.trace} if _profiler is not None else None
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_generator, initargs=(spec, out_dir, profile)) as executor:
+            for snapshot in executor.map(_generate_image, todo, chunksize=chunksize):
+                if snapshot is not None and _profiler is not None:
+                    _profiler.merge(snapshot)
+
+    return {"generated": len(todo), "skipped": len(images) - len(todo)}
+
+_generator_state = None
+
+def _init_generator(spec, out_dir, profile=None):
+    # Load the objects once per worker process
+    global _generator_state
+    if profile is not None:
+        # Start from an empty profiler, a forked worker inherits the parent's
+        enable_profiling(**profile)
+    kind = spec["kind"]
+    if kind == "3d_model":
+        init_poses = spec.get("init_poses", {})
+        objects = []
+        for path in spec["objects"]:
+            name = os.path.splitext(os.path.basename(path))[0]
+            objects.append((name, load_3d_model(path), tuple(init_poses.get(name, (0, -90, 0)))))
+    elif kind == "clip_art":
+        objects = list(spec["objects"])
+    else:
+        raise ValueError(f"Unsupported dataset kind: {kind}")
+
+    cache_dir = spec.get("sprite_cache")
+    _generator_state = {
+        "spec": spec,
+        "out_dir": out_dir,
+        "objects": objects,
+        "meshes": {name: mesh_arrays(model) for name, model, _ in objects}
+                  if kind == "3d_model" and spec.get("renderer") == "raster" else {},
+        "sprite_cache": SpriteCache(cache_dir=cache_dir) if cache_dir is not None else None,
+        "canvas_cache": files.canvas_cache(spec["canvas_cache"], max_bytes=spec.get("canvas_cache_bytes", 2 * 2**30))
+                        if spec.get("canvas_cache") else None,
+        "plan": PlacementPlan(spec["plan"]) if isinstance(spec.get("plan"), str) else spec.get("plan"),
+        "profile": profile is not None,
+    }
+
+def _generate_image(task):
+    i, seed_seq = task
+    state = _generator_state
+    spec = state["spec"]
+    rng = np.random.default_rng(seed_seq)
+    plan = state["plan"]
+
+    # Randomly select a canvas image
+    canvas_path = spec["canvases"][plan.canvas[i] if plan is not None else rng.integers(len(spec["canvases"]))]
+    with stage("canvas"):
+        if state["canvas_cache"] is not None:
+            canvas = state["canvas_cache"].get(canvas_path)
+        else:
+            with Image.open(canvas_path) as img:
+                canvas = np.array(img.convert("RGB"))
+    canvas_size = (canvas.shape[1], canvas.shape[0])
+
+    placements = []
+    if plan is not None:
+        placements = [placement for placement in (_planned_sprite(state, obj, canvas_size) for obj in plan.objects(i))
+                      if placement is not None]
+    num_objects = 0 if plan is not None else rng.integers(low=1, high=spec.get("max_objects", 5) + 1)
+    for _ in range(num_objects):
+        obj = state["objects"][rng.integers(len(state["objects"]))]
+        obj_seed = int(rng.integers(2**32))
+
+        if spec["kind"] == "3d_model":
+            name, model, init_pose = obj
+            if state["meshes"]:
+                # Rasterized at the scaled width, so there is nothing to resize
+                color, pose = random_pose(randomize=True, seed=obj_seed)
+                width = int(rng_scale(seed=obj_seed) * canvas_size[0])
+                obj_img = rasterize_mesh(state["meshes"][name], init_pose, pose, color, width)
+            elif state["sprite_cache"] is not None:
+                obj_img = state["sprite_cache"].sprite(name, model, *init_pose, randomize=True, seed=obj_seed)
+            else:
+                obj_img = render_context().render(model, *init_pose, randomize=True, seed=obj_seed)
+        else:
+            with Image.open(obj) as img:
+                obj_img = img.copy()
+            num_transforms = rng.integers(low=0, high=spec.get("max_transforms", 3) + 1)
+            for t in range(num_transforms):
+                obj_img = rng_transform(obj_img, seed=obj_seed + t)
+
+        # A fully keyed cutout has nothing to place
+        if 0 in obj_img.size:
+            continue
+
+        # Scale and position the object
+        if not state["meshes"]:
+            obj_img = scale_obj(obj_img, rng_scale(seed=obj_seed), canvas_size)
+        coordinates_topleft = rng_position(obj_img.size, canvas_size, seed=obj_seed)
+        placements.append((np.asarray(obj_img.convert("RGBA")), coordinates_topleft))
+
+    # Blend all objects at once, class is 0 since all objects are the same class
+    canvas, labels = composite(canvas, placements)
+    base_name = f"{spec.get('prefix', 'synth_img_')}{i:05d}"
+    output = spec.get("output", "full")
+    write_full = output in ("full", "both")
+
+    if output in ("tiles", "both"):
+        from . import image_data
+
+        # Tile views of the composite, with the boxes remapped in memory
+        boxes = np.array(labels, dtype=np.float64).reshape(-1, 5)
+        with stage("tiles") as tiles_written:
+            tiles_written.nbytes = image_data.tile_array(canvas, spec.get("tile_dir", state["out_dir"]), base_name,
+                                                         boxes=boxes, rgb=True, **spec.get("tiling", {}))
+        # Too small to tile, keep the full image as the tiling notebooks do
+        write_full = write_full or not tiles_written.nbytes
+
+    if write_full:
+        # Write to temporary files and rename, so a partial image is never resumed from
+        base_path = os.path.join(state["out_dir"], base_name)
+        with stage("encode"):
+            encoded = io.BytesIO()
+            Image.fromarray(canvas).save(encoded, format="PNG")
+            encoded = encoded.getbuffer()
+        with stage("write", nbytes=encoded.nbytes) as written:
+            written.nbytes += write_labels(base_path + ".txt.tmp", labels)
+            with open(base_path + ".png.tmp", "wb") as png_file:
+                png_file.write(encoded)
+            os.replace(base_path + ".txt.tmp", base_path + ".txt")
+            os.replace(base_path + ".png.tmp", base_path + ".png")
+
+    # Persist newly rendered sprites with the image, the store holds one file per
+    # sprite so batching saves no writes, and a worker's last sprites are not lost
+    if state["sprite_cache"] is not None:
+        state["sprite_cache"].flush()
+
+    if state["profile"]:
+        return _profiler.drain()
+
+def _planned_sprite(state, planned, canvas_size):
+    # Draw one object of a PlacementPlan and its top-left position on the canvas, None if it is empty
+    obj_idx, scale, position, color, pose, transforms = planned
+    obj = state["objects"][obj_idx]
+
+    if state["spec"]["kind"] == "3d_model":
+        name, model, init_pose = obj
+        if state["meshes"]:
+            obj_img = rasterize_mesh(state["meshes"][name], init_pose, pose, color, max(1, int(scale * canvas_size[0])))
+        elif state["sprite_cache"] is not None:
+            obj_img = state["sprite_cache"].get(name, model, init_pose, pose, color)
+        else:
+            obj_img = render_context().render_pose(model, init_pose, pose, color)
+    else:
+        with Image.open(obj) as img:
+            arr = np.asarray(img.convert("RGBA"))
+        if transforms:
+            # The whole chain at once, consecutive color transforms share one HSV round trip
+            with stage("rng_transform"):
+                arr = apply_transforms(arr, transforms)
+        obj_img = Image.fromarray(arr, "RGBA")
+
+    if 0 in obj_img.size:
+        return None
+    if not state["meshes"]:
+        obj_img = scale_obj(obj_img, scale, canvas_size)
+    free_w, free_h = canvas_size[0] - obj_img.size[0], canvas_size[1] - obj_img.size[1]
+    if state["plan"].centered:
+        # Center the object on the planned box center, kept inside the canvas
+        x_pos = int(np.clip(position[0] * canvas_size[0] - obj_img.size[0] / 2, 0, max(free_w, 0)))
+        y_pos = int(np.clip(position[1] * canvas_size[1] - obj_img.size[1] / 2, 0, max(free_h, 0)))
+    else:
+        # Same mapping as rng_position, the object never overlaps an edge
+        x_pos = int(position[0] * free_w)
+        y_pos = int(position[1] * free_h)
+    return np.asarray(obj_img.convert("RGBA")), (x_pos, y_pos)
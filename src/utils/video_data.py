@@ -1,5 +1,14 @@
 import os
+import json
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
 import cv2
+import numpy as np
+
+from . import files
+from . import image_data
+from . import label_data
 
 def to_frames(file_name, input_folder, output_folder):
     '''
@@ -28,6 +37,135 @@ def to_frames(file_name, input_folder, output_folder):
     cap.release()
     print(f"Extracted {frame_count} frames to {output_folder}")
     
+def extract_frames(file_name, input_folder, output_folder, codec='png', png_compression=3, jpeg_quality=95,
+                   every_nth=1, frames=None, workers=4, queue_size=32, chunk_size=256, blank_threshold=None,
+                   skip_blank=False):
+    '''
+    Stream a video file to frames, encoding on a bounded pool of worker threads.
+
+    Decoding stays on the calling thread while frames are encoded and written
+    by up to `workers` threads, with at most `queue_size` frames in flight.
+    codec is 'png' (with png_compression 0-9), 'jpg' (with jpeg_quality
+    0-100) or 'npy' for raw uncompressed chunks of chunk_size frames, saved
+    as .npz files holding a 'frames' array and the matching 'index' array.
+    Frames of the chunk being filled count as in flight, so chunks hold at
+    most queue_size frames (raise queue_size for larger chunks).
+    Only every Nth frame is kept, and if frames is given only those frame
+    numbers (e.g. label_data.annotated_frames) are kept. Skipped frames are
+    grabbed without being decoded. If blank_threshold is given, each kept
+    frame is checked with image_data.is_blank_array while still in memory and
+    the blank frame numbers are saved to <base>_blank_frames.json, with
+    skip_blank they are not written at all. Returns the number of frames written.
+    '''
+    video_file_path = os.path.join(input_folder, file_name)
+    base_name = os.path.splitext(file_name)[0]
+    os.makedirs(output_folder, exist_ok=True)
+
+    if codec == 'png':
+        ext, params = '.png', [cv2.IMWRITE_PNG_COMPRESSION, png_compression]
+    elif codec == 'jpg':
+        ext, params = '.jpg', [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality]
+    elif codec != 'npy':
+        raise ValueError(f"Unsupported codec: {codec}")
+    frames = set(frames) if frames is not None else None
+    last_frame = max(frames, default=-1) if frames is not None else None
+
+    def write_image(frame_number, frame):
+        try:
+            frame_filename = os.path.join(output_folder, f"{base_name}_frame_{frame_number:04d}{ext}")
+            cv2.imwrite(frame_filename, frame, params)
+        finally:
+            slots.release()
+
+    def write_chunk(index, chunk):
+        try:
+            chunk_filename = os.path.join(output_folder, f"{base_name}_frames_{index[0]:04d}.npz")
+            np.savez(chunk_filename, frames=np.stack(chunk), index=np.asarray(index))
+        finally:
+            slots.release(len(chunk))
+
+    # Bound the frames held in memory while the encoders catch up, one slot per frame
+    slots = threading.Semaphore(queue_size)
+    chunk_size = max(1, min(chunk_size, queue_size))
+    cap = cv2.VideoCapture(video_file_path)
+    frame_number = 0
+    written = 0
+    chunk, chunk_index = [], []
+    pending = []
+    blank_frames = []
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while True:
+            if last_frame is not None and frame_number > last_frame:
+                break
+            keep = frame_number % every_nth == 0 and (frames is None or frame_number in frames)
+            if not keep:
+                # Advance the stream without decoding the frame
+                if not cap.grab():
+                    break
+                frame_number += 1
+                continue
+
+            slots.acquire()
+            ret, frame = cap.read()
+            if not ret:
+                slots.release()
+                break
+
+            if blank_threshold is not None and image_data.is_blank_array(frame, blank_threshold):
+                blank_frames.append(frame_number)
+                if skip_blank:
+                    slots.release()
+                    frame_number += 1
+                    continue
+
+            if codec == 'npy':
+                chunk.append(frame)
+                chunk_index.append(frame_number)
+                if len(chunk) == chunk_size:
+                    pending.append(executor.submit(write_chunk, chunk_index, chunk))
+                    chunk, chunk_index = [], []
+            else:
+                pending.append(executor.submit(write_image, frame_number, frame))
+
+            written += 1
+            frame_number += 1
+
+        if chunk:
+            pending.append(executor.submit(write_chunk, chunk_index, chunk))
+
+    cap.release()
+
+    # Surface any encoding errors
+    for future in pending:
+        future.result()
+
+    if blank_threshold is not None:
+        with open(os.path.join(output_folder, f"{base_name}_blank_frames.json"), 'w') as f:
+            json.dump({'threshold': blank_threshold, 'skipped': skip_blank, 'frames': blank_frames}, f)
+
+    print(f"Extracted {written} frames to {output_folder}")
+    return written
+
+def extract_directory(input_folder, output_folder, video_workers=4, annotated_only=False, **kwargs):
+    '''
+    Extract frames from every video in a directory, several videos at a time.
+
+    Each video is handled by its own process, which runs extract_frames with
+    its own pool of encoder threads. With annotated_only, only frames that
+    have objects in the video's annotation file are kept. Extra keyword
+    arguments are passed to extract_frames. Returns a dict of frame counts.
+    '''
+    video_files = sorted(files.get_video_files(input_folder))
+
+    with ProcessPoolExecutor(max_workers=video_workers) as executor:
+        futures = {}
+        for video_file in video_files:
+            frames = label_data.annotated_frames(video_file, input_folder) if annotated_only else None
+            futures[video_file] = executor.submit(
+                extract_frames, video_file, input_folder, output_folder, frames=frames, **kwargs)
+        return {video_file: future.result() for video_file, future in futures.items()}
+
 def get_resolution(file_name, input_folder):
     '''
     Get the resolution of a video file.
@@ -39,6 +177,45 @@ def get_resolution(file_name, input_folder):
     cap.release()
     return width, height
 
+def probe_resolution(file_name, input_folder, cache_file=None):
+    '''
+    Get the resolution of a video file through a shared probe cache.
+
+    Results are memoized per process and, if cache_file is given, in a JSON
+    file keyed on the video path, size and mtime, so each video is opened
+    at most once across processes and reruns.
+    '''
+    video_path = os.path.join(input_folder, file_name)
+    stat = os.stat(video_path)
+    key = f"{os.path.abspath(video_path)}|{stat.st_size}|{stat.st_mtime_ns}"
+
+    if key in _probe_cache:
+        return _probe_cache[key]
+
+    if cache_file is not None and os.path.exists(cache_file):
+        with open(cache_file, 'r') as f:
+            _probe_cache.update((k, tuple(v)) for k, v in json.load(f).items())
+        if key in _probe_cache:
+            return _probe_cache[key]
+
+    _probe_cache[key] = get_resolution(file_name, input_folder)
+
+    if cache_file is not None:
+        # Merge with entries other processes may have written, then replace atomically
+        entries = {}
+        if os.path.exists(cache_file):
+            with open(cache_file, 'r') as f:
+                entries = json.load(f)
+        entries.update(_probe_cache)
+        tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+        with open(tmp_file, 'w') as f:
+            json.dump(entries, f, indent=1)
+        os.replace(tmp_file, cache_file)
+
+    return _probe_cache[key]
+
+_probe_cache = {}
+
 def get_duration(file_name, input_folder):
     '''
     Get the duration of a video file.